@@ -0,0 +1,126 @@
+import sqlite3
+
+import numpy as np
+
+from all_contrat.events import Action
+
+
+class SalesHistory:
+    """Completed sales as NumPy columns, sorted by collection, currency and time.
+
+    Sales of one (nft_app_id, currency) pair are contiguous, so every aggregate is one vectorised
+    pass over the columns with the group boundaries in `starts`. Each sale is one NFT, which makes
+    the VWAP the volume divided by the number of sales. Amounts are in the currency's base unit.
+    """
+
+    def __init__(self, nft_app_id, currency, amount, created_at):
+        nft_app_id = np.asarray(nft_app_id, dtype=np.uint64)
+        currency = np.asarray(currency, dtype=np.uint64)
+        order = np.lexsort((created_at, currency, nft_app_id))
+        self.nft_app_id = nft_app_id[order]
+        self.currency = currency[order]
+        self.amount = np.asarray(amount, dtype=np.uint64)[order]
+        self.created_at = np.asarray(created_at, dtype=np.int64)[order]
+        new_group = np.ones(len(order), dtype=bool)
+        new_group[1:] = (self.nft_app_id[1:] != self.nft_app_id[:-1]) | (self.currency[1:] != self.currency[:-1])
+        self.starts = np.flatnonzero(new_group)
+        # group number of every sale
+        self.group = np.cumsum(new_group) - 1
+
+    def __len__(self):
+        return len(self.amount)
+
+    @classmethod
+    def from_events(cls, events):
+        """Build from an event stream; sales are attributed to the collection of their app's creation event."""
+        collections = dict()
+        sales = []
+        for event in events:
+            if event.nft_app_id is not None:
+                collections[event.app_id] = event.nft_app_id
+            if event.type == Action.BUY and event.amount is not None and event.app_id in collections:
+                sales.append((collections[event.app_id], event.currency or 0, event.amount, event.created_at))
+        return cls(*(zip(*sales) if sales else ([], [], [], [])))
+
+    @classmethod
+    def from_database(cls, path: str, chain: str = None):
+        """Build from the events table of an SQLite database written by SqliteSink."""
+        query = (
+            "SELECT listing.nft_app_id, COALESCE(sale.currency, 0), sale.amount, sale.created_at "
+            "FROM events AS sale JOIN events AS listing ON listing.app_id = sale.app_id AND listing.chain = sale.chain "
+            "AND listing.type = 'create' "
+            "WHERE sale.type = 'buy' AND sale.amount IS NOT NULL AND listing.nft_app_id IS NOT NULL"
+        )
+        parameters = ()
+        if chain is not None:
+            query += ' AND sale.chain = ?'
+            parameters = (chain,)
+        connection = sqlite3.connect(path)
+        try:
+            # currencies and amounts are stored as text, see sinks.event_row
+            rows = [(nft_app_id, int(currency), int(amount), created_at)
+                    for nft_app_id, currency, amount, created_at in connection.execute(query, parameters)]
+        finally:
+            connection.close()
+        return cls(*(zip(*rows) if rows else ([], [], [], [])))
+
+    def since(self, created_at: int):
+        """The sales at or after a timestamp."""
+        keep = self.created_at >= created_at
+        return SalesHistory(self.nft_app_id[keep], self.currency[keep], self.amount[keep], self.created_at[keep])
+
+    def stats(self, percentiles=(25, 50, 75)):
+        """Return a dict of per (nft_app_id, currency) columns.
+
+        Columns are nft_app_id, currency, count, volume, floor (lowest sale), ceiling (highest
+        sale), vwap and one `p<N>` column per requested percentile.
+        """
+        if len(self) == 0:
+            empty = np.zeros(0, dtype=np.uint64)
+            return dict({'nft_app_id': empty, 'currency': empty, 'count': empty, 'volume': empty, 'floor': empty,
+                         'ceiling': empty, 'vwap': np.zeros(0)}, **{'p%g' % p: np.zeros(0) for p in percentiles})
+        counts = np.diff(np.append(self.starts, len(self)))
+        volume = np.add.reduceat(self.amount, self.starts)
+        result = {
+            'nft_app_id': self.nft_app_id[self.starts],
+            'currency': self.currency[self.starts],
+            'count': counts,
+            'volume': volume,
+            'floor': np.minimum.reduceat(self.amount, self.starts),
+            'ceiling': np.maximum.reduceat(self.amount, self.starts),
+            'vwap': volume / counts,
+        }
+        # sort amounts inside each group, then interpolate between the two closest ranks like np.percentile
+        ranked = self.amount[np.lexsort((self.amount, self.group))].astype(np.float64)
+        for p in percentiles:
+            position = (counts - 1) * (p / 100)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, counts - 1)
+            fraction = position - lower
+            result['p%g' % p] = (ranked[self.starts + lower] * (1 - fraction) + ranked[self.starts + upper] * fraction)
+        return result
+
+    def rolling_volume(self, window: int = 86400):
+        """Volume of each sale's group over the `window` seconds ending at that sale, inclusive."""
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.uint64)
+        # offsetting every group past the previous one keeps the windows from crossing groups
+        span = int(self.created_at.max() - self.created_at.min()) + window + 1
+        time = (self.created_at - self.created_at.min()) + self.group * span
+        first = np.searchsorted(time, time - window, side='right')
+        total = np.concatenate(([0], np.cumsum(self.amount)))
+        return total[np.arange(1, len(self) + 1)] - total[first]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print sales statistics per collection and currency.')
+    parser.add_argument('--database', default='indexer.sqlite', help='SQLite file written by the pipeline')
+    parser.add_argument('--chain', default=None)
+    parser.add_argument('--since', type=int, default=0, help='only count sales at or after this unix timestamp')
+    args = parser.parse_args()
+
+    stats = SalesHistory.from_database(args.database, args.chain).since(args.since).stats()
+    for i in range(len(stats['count'])):
+        print({name: column[i].item() for name, column in stats.items()})
@@ -0,0 +1,45 @@
+import numpy as np
+
+from all_contrat.analytics import SalesHistory
+from all_contrat.fixtures import sample_transaction, sample_context
+from all_contrat.decoders import decode_transaction
+from all_contrat.sinks import SqliteSink
+
+
+def test_stats_per_collection_and_currency():
+    history = SalesHistory(
+        nft_app_id=[7, 7, 7, 9, 7, 7],
+        currency=[0, 0, 0, 0, 5, 0],
+        amount=[300, 100, 200, 50, 10, 400],
+        created_at=[30, 10, 20, 10, 10, 100],
+    )
+    stats = history.stats(percentiles=(50, 90))
+    assert stats['nft_app_id'].tolist() == [7, 7, 9]
+    assert stats['currency'].tolist() == [0, 5, 0]
+    assert stats['count'].tolist() == [4, 1, 1]
+    assert stats['volume'].tolist() == [1000, 10, 50]
+    assert stats['floor'].tolist() == [100, 10, 50]
+    assert stats['vwap'].tolist() == [250, 10, 50]
+    assert stats['p90'][0] == np.percentile([100, 200, 300, 400], 90)
+    assert stats['p50'].tolist() == [250, 10, 50]
+    assert history.rolling_volume(window=15).tolist() == [100, 300, 500, 400, 10, 50]
+    assert history.since(20).stats()['count'].tolist() == [3]
+
+
+def test_sales_are_attributed_to_the_listing_collection(tmp_path):
+    context = sample_context()
+    events = [decode_transaction(sample_transaction(note, 0, price=price), context)._replace(id='TX%d' % i)
+              for i, (note, price) in enumerate((('sale,create,1/72', 0), ('sale,buy,1/72', 700),
+                                                 ('sale,buy,200/72', 5)))]
+    # the second buy is for an app whose creation was not seen
+    events[2] = events[2]._replace(app_id=2000)
+    stats = SalesHistory.from_events(events).stats()
+    assert stats['nft_app_id'].tolist() == [events[0].nft_app_id]
+    assert stats['volume'].tolist() == [700]
+
+    path = str(tmp_path / 'indexer.sqlite')
+    sink = SqliteSink(path)
+    for event in events:
+        sink.write(event)
+    sink.close()
+    assert SalesHistory.from_database(path).stats()['volume'].tolist() == [700]
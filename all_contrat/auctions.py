@@ -0,0 +1,60 @@
+from typing import NamedTuple, Optional
+
+from all_contrat.events import Action, Kind, MarketEvent
+from all_contrat.sinks import Sink
+
+
+# late_bid_delay set by every auction contract on creation
+LATE_BID_DELAY = 600
+
+
+class Auction(NamedTuple):
+    app_id: int
+    nft_app_id: Optional[int]
+    nft_id: Optional[int]
+    currency: int
+    seller: str
+    min_price: int
+    end: int
+    bid_amount: int = 0
+    bidder: Optional[str] = None
+
+
+class AuctionBook(Sink):
+    """Live state of the open english auctions, updated as each event arrives.
+
+    Bids replace the leading bid and bidder and push `end` out the way the contracts do: a bid
+    at time t extends the auction to t + late_bid_delay when that is past the current end.
+    Auctions leave the book when they are closed or cancelled. Events for auctions whose
+    creation was not seen are ignored.
+    """
+
+    def __init__(self, late_bid_delay: int = LATE_BID_DELAY):
+        self.late_bid_delay = late_bid_delay
+        self.auctions = dict()
+
+    def __len__(self):
+        return len(self.auctions)
+
+    def get(self, app_id: int):
+        return self.auctions.get(app_id)
+
+    def ending_before(self, timestamp: int):
+        """Return the auctions with a bid that can be closed at `timestamp`."""
+        return [auction for auction in self.auctions.values() if auction.bidder is not None and auction.end <= timestamp]
+
+    def write(self, event: MarketEvent):
+        if event.kind != Kind.AUCTION:
+            return
+        if event.type == Action.CREATE:
+            self.auctions[event.app_id] = Auction(event.app_id, event.nft_app_id, event.nft_id, event.currency or 0,
+                                                  event.from_address, event.amount, event.end)
+        elif event.type == Action.BID:
+            auction = self.auctions.get(event.app_id)
+            if auction is not None:
+                end = auction.end
+                if event.created_at + self.late_bid_delay >= end:
+                    end = event.created_at + self.late_bid_delay
+                self.auctions[event.app_id] = auction._replace(bid_amount=event.amount, bidder=event.from_address, end=end)
+        elif event.type in (Action.CLOSE, Action.CANCEL):
+            self.auctions.pop(event.app_id, None)
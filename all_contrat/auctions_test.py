@@ -0,0 +1,24 @@
+from all_contrat.auctions import AuctionBook
+from all_contrat.events import Action, Kind, Market, new_market_event
+
+
+def event(action: Action, created_at: int, amount=None, from_address='SELLER', end=None):
+    return new_market_event('TX', 1, created_at, from_address, 'voi:testnet', 1, Kind.AUCTION, action,
+                            Market.VOI_ARC72, amount, 0, 50, 7, end)
+
+
+def test_bids_track_leader_and_extend_end():
+    book = AuctionBook()
+    book.write(event(Action.CREATE, 1000, 100, end=5000))
+    book.write(event(Action.BID, 2000, 150, from_address='ALICE'))
+    assert book.get(1).bidder == 'ALICE'
+    assert book.get(1).end == 5000
+
+    book.write(event(Action.BID, 4900, 200, from_address='BOB'))
+    assert book.get(1).bid_amount == 200
+    assert book.get(1).end == 5500
+    assert book.ending_before(5400) == []
+    assert [auction.bidder for auction in book.ending_before(5500)] == ['BOB']
+
+    book.write(event(Action.CLOSE, 5600, 200, from_address='BOB'))
+    assert len(book) == 0
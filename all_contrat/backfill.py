@@ -0,0 +1,126 @@
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.request import pathname2url
+
+from all_contrat import indexer
+from all_contrat.decoders import decode_dispatched, dispatch
+from all_contrat.dedupe import Deduplicator
+from all_contrat.networks import PROFILES
+from all_contrat.sinks import Sink, SqliteSink
+
+
+def shard_ranges(min_round: int, max_round: int, shard_size: int):
+    """Split [min_round, max_round] into consecutive inclusive ranges of at most shard_size rounds."""
+    return [(start, min(start + shard_size - 1, max_round)) for start in range(min_round, max_round + 1, shard_size)]
+
+
+def index_shard(shard):
+    """Fetch and decode one shard in a worker process, returning its events in round order.
+
+    Network.fetch_page hands out the transactions of the fees address oldest first. With a
+    database, the transactions whose id its events table already holds are skipped before they
+    are decoded, so rescanning indexed rounds fetches no state or programs for them.
+    """
+    chain, min_round, max_round, next_page, database = shard
+    network = indexer.get_network(chain)
+    connection = None
+    if database is not None:
+        # read only, the sink in the parent process is the one writer
+        connection = sqlite3.connect('file:%s?mode=ro' % pathname2url(database), uri=True)
+    events = []
+    try:
+        for transaction in network.scan_transactions(min_round, max_round, next_page=next_page):
+            network.observe(transaction)
+            dispatched = dispatch(transaction, network.context)
+            if dispatched is None:
+                continue
+            if connection is not None and connection.execute(
+                    'SELECT 1 FROM events WHERE id = ?', (transaction['id'],)).fetchone() is not None:
+                continue
+            event = decode_dispatched(transaction, dispatched, network.context)
+            if event is not None:
+                events.append(event)
+    finally:
+        if connection is not None:
+            connection.close()
+    return events
+
+
+def write_shard(sink: Sink, shard, min_round: int, max_round: int, dedupe: Deduplicator = None):
+    end, future = shard
+    for event in future.result():
+        if dedupe is None or dedupe.admit(event.id):
+            sink.write(event)
+    sink.advance(end, min_round, max_round)
+
+
+def backfill(min_round: int, max_round: int, sink: Sink, shard_size: int = 10_000, workers: int = None,
+             chain: str = indexer.DEFAULT_CHAIN, dedupe: Deduplicator = None, window: int = None, executor=None,
+             database: str = None):
+    """Index a large round range with shards fetched and decoded in parallel worker processes.
+
+    Shards are handed to the sink in round order as soon as every shard before them is done,
+    and the sink's cursor advances to the end of each shard, so an interrupted backfill resumes
+    at the first shard that was not written. At most `window` shards are in flight, so finished
+    shards waiting on a slow one do not pile up in memory.
+
+    Args:
+        min_round: First round to index.
+        max_round: Last round to index (inclusive).
+        sink: Receives the merged events and the cursor after each shard.
+        shard_size: Number of rounds per shard.
+        workers: Number of worker processes, defaults to the number of CPUs.
+        chain: Network profile the workers index.
+        dedupe: Drops the events already written, e.g. by an overlapping backfill, or by shards
+            still in flight when their worker checked the database.
+        window: Number of shards submitted ahead of the one being written, defaults to twice the workers.
+        executor: Runs index_shard, defaults to a ProcessPoolExecutor of `workers` processes.
+        database: SQLite file whose events the workers skip before decoding, usually the sink's.
+    """
+    min_round, next_page = sink.resume(min_round, max_round)
+    shards = [(chain, start, end, None, database) for start, end in shard_ranges(min_round, max_round, shard_size)]
+    if shards and next_page is not None:
+        shards[0] = (chain, shards[0][1], shards[0][2], next_page, database)
+    if window is None:
+        window = 2 * (workers or os.cpu_count() or 1)
+    owned = executor is None
+    if owned:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    # futures are written in submission order, which merges the shards in round order
+    in_flight = deque()
+    try:
+        for shard in shards:
+            if len(in_flight) >= window:
+                write_shard(sink, in_flight.popleft(), min_round, max_round, dedupe)
+            in_flight.append((shard[2], executor.submit(index_shard, shard)))
+        while in_flight:
+            write_shard(sink, in_flight.popleft(), min_round, max_round, dedupe)
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+        if owned:
+            executor.shutdown()
+    sink.flush()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Backfill marketplace events with parallel shards.')
+    parser.add_argument('--chain', choices=sorted(PROFILES), default=indexer.DEFAULT_CHAIN)
+    parser.add_argument('--min-round', type=int, required=True)
+    parser.add_argument('--max-round', type=int, required=True)
+    parser.add_argument('--shard-size', type=int, default=10_000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--database', default='indexer.sqlite', help='SQLite file holding the events and the cursor')
+    args = parser.parse_args()
+
+    # a cursor of its own, a pipeline over another range on the same database would move it
+    sink = SqliteSink(args.database, '%s/backfill' % args.chain)
+    try:
+        backfill(args.min_round, args.max_round, sink, args.shard_size, args.workers, args.chain, Deduplicator(sink),
+                 database=args.database)
+    finally:
+        sink.close()
@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from all_contrat import backfill, indexer
+from all_contrat.fixtures import sample_transaction, sample_context
+from all_contrat.sinks import SqliteSink
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """Records the peak number of shards submitted but not yet written to the sink."""
+
+    def __init__(self, written):
+        super().__init__(max_workers=2)
+        self.written = written
+        self.submitted = 0
+        self.peak = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted += 1
+        self.peak = max(self.peak, self.submitted - len(self.written))
+        return super().submit(fn, *args, **kwargs)
+
+
+def test_backfill_writes_shards_in_round_order_and_resumes(monkeypatch, tmp_path):
+    transactions = [sample_transaction('sale,buy,1/72', round_num, round_num=round_num) for round_num in range(1, 101)]
+    fetched = []
+
+    def fetch_page(address, min_round, max_round, next_page):
+        fetched.append((min_round, max_round))
+        return [tx for tx in transactions if min_round <= tx['confirmed-round'] <= max_round], None
+
+    network = indexer.Network(indexer.PROFILES['voi:testnet'])
+    network.fetch_page = fetch_page
+    network.context = sample_context()
+    monkeypatch.setitem(indexer.NETWORKS, 'voi:testnet', network)
+    sink = SqliteSink(str(tmp_path / 'indexer.sqlite'), 'voi:testnet/backfill', flush_interval=0)
+
+    written = []
+    advance = sink.advance
+    monkeypatch.setattr(sink, 'advance', lambda round_num, *args: written.append(round_num) or advance(round_num, *args))
+    executor = CountingExecutor(written)
+    backfill.backfill(1, 100, sink, shard_size=10, window=3, executor=executor)
+    rounds = sink.connection.execute('SELECT round FROM events ORDER BY rowid').fetchall()
+    assert [round_num for round_num, in rounds] == list(range(1, 101))
+    assert sink.checkpoint.load()[0] == 100
+    assert written == list(range(10, 101, 10))
+    assert executor.peak == 3
+
+    # rerunning the finished range fetches nothing and keeps the cursor
+    fetched.clear()
+    backfill.backfill(1, 100, sink, shard_size=10, window=3, executor=executor)
+    assert fetched == []
+    assert sink.checkpoint.load()[0] == 100
+    executor.shutdown()
+    sink.close()
+
+
+def test_backfill_workers_skip_stored_transactions_before_decoding(monkeypatch, tmp_path):
+    transactions = [sample_transaction('sale,buy,1/72', round_num, round_num=round_num) for round_num in range(1, 21)]
+    network = indexer.Network(indexer.PROFILES['voi:testnet'])
+    network.fetch_page = lambda address, min_round, max_round, next_page: (
+        [tx for tx in transactions if min_round <= tx['confirmed-round'] <= max_round], None)
+    network.context = sample_context()
+    monkeypatch.setitem(indexer.NETWORKS, 'voi:testnet', network)
+    path = str(tmp_path / 'indexer.sqlite')
+    # a pipeline already indexed the first half of the range
+    pipeline_sink = SqliteSink(path, 'voi:testnet', flush_interval=0)
+    for transaction in transactions[:10]:
+        pipeline_sink.write(indexer.decode_transaction(transaction, network.context))
+    pipeline_sink.close()
+
+    decoded = []
+    decode = backfill.decode_dispatched
+    monkeypatch.setattr(backfill, 'decode_dispatched',
+                        lambda transaction, *args: decoded.append(transaction['id']) or decode(transaction, *args))
+    sink = SqliteSink(path, 'voi:testnet/backfill', flush_interval=0)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        backfill.backfill(1, 20, sink, shard_size=5, executor=executor, database=path)
+    assert sorted(decoded) == sorted(transaction['id'] for transaction in transactions[10:])
+    assert sink.connection.execute('SELECT COUNT(*) FROM events').fetchone()[0] == 20
+    sink.close()
@@ -0,0 +1,113 @@
+import gc
+import os
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+from all_contrat.constants import FEES_ADDRESS
+from all_contrat.decoders import DECODERS, decode_transaction, dispatch, fee_note, split_note
+from all_contrat.fixtures import sample_context, sample_transactions
+from all_contrat.recording import Recording
+from all_contrat.sinks import SqliteSink
+
+
+def recorded_transactions(path: str):
+    """Return the fee address transactions of the indexer pages in a recording made with --record."""
+    transactions = []
+    for key, response in Recording(path).responses.items():
+        if key.startswith('indexer ') and isinstance(response, dict):
+            transactions.extend(response.get('transactions', []))
+    return transactions
+
+
+def measure(stage, items, repeat: int = 3):
+    """Time `stage` over `items` (best of `repeat` runs), then run it once more under tracemalloc.
+
+    Returns events/sec, the number of memory blocks still allocated per event afterwards and the
+    peak traced memory per event in bytes.
+    """
+    elapsed = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        stage(items)
+        elapsed = min(elapsed, perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = stage(items)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return {
+        'events_per_sec': round(len(items) / elapsed),
+        'blocks_per_event': round(blocks / len(items), 2),
+        'peak_bytes_per_event': round(peak / len(items), 1),
+    }
+
+
+def run_benchmarks(transactions):
+    """Time each decode stage, then the SQLite sink, over the same transactions."""
+    context = sample_context()
+    notes = [fee_note(transaction, FEES_ADDRESS) for transaction in transactions
+             if 'inner-txns' in transaction]
+    dispatched = [(transaction, pair) for transaction, pair in
+                  ((transaction, dispatch(transaction, context)) for transaction in transactions) if pair is not None]
+    events = [decoder(transaction, note, context) for transaction, (decoder, note) in dispatched]
+
+    def sink_writes(events):
+        with tempfile.TemporaryDirectory() as directory:
+            sink = SqliteSink(os.path.join(directory, 'bench.sqlite'))
+            for event in events:
+                sink.write(event)
+            sink.close()
+
+    stages = (
+        ('note_decode', lambda items: [fee_note(transaction, FEES_ADDRESS) for transaction in items], transactions),
+        ('dispatch', lambda items: [DECODERS.get(split_note(note)) for note in items if note is not None], notes),
+        ('decode', lambda items: [decoder(transaction, note, context) for transaction, (decoder, note) in items],
+         dispatched),
+        ('end_to_end', lambda items: [decode_transaction(transaction, context) for transaction in items], transactions),
+        ('sqlite_sink', sink_writes, events),
+    )
+    return {name: measure(stage, items) for name, stage, items in stages}
+
+
+def regressions(results, baseline, tolerance: float):
+    """Return the stages whose throughput fell more than `tolerance` below the baseline."""
+    return [name for name, result in results.items()
+            if name in baseline and result['events_per_sec'] < baseline[name]['events_per_sec'] * (1 - tolerance)]
+
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description='Benchmark the indexer decode stages.')
+    parser.add_argument('--count', type=int, default=100_000, help='number of synthetic transactions')
+    parser.add_argument('--recording', help='use the transactions of a .jsonl.gz recording instead')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.3)
+    args = parser.parse_args()
+
+    transactions = recorded_transactions(args.recording) if args.recording else sample_transactions(args.count)
+    results = run_benchmarks(transactions)
+    for name, result in results.items():
+        print('%-12s %10d events/sec %8.2f blocks/event %10.1f peak bytes/event' % (
+            name, result['events_per_sec'], result['blocks_per_event'], result['peak_bytes_per_event']))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            slower = regressions(results, json.load(file), args.tolerance)
+        if slower:
+            print('regression against %s: %s' % (args.baseline, ', '.join(slower)))
+            sys.exit(1)
@@ -0,0 +1,99 @@
+from base64 import b32encode, b64encode
+
+import msgpack
+from algosdk import encoding
+from algosdk.v2client.algod import AlgodClient
+
+
+def b64(value: bytes):
+    return b64encode(value).decode()
+
+
+def as_bytes(value):
+    """Bytes of a block field that algod encodes as a msgpack str although it holds binary data."""
+    return value.encode('utf-8', 'surrogateescape') if isinstance(value, str) else value
+
+
+def transaction_id(txn: dict):
+    return b32encode(encoding.checksum(b"TX" + msgpack.packb(encoding._sort_dict(txn), use_bin_type=True))).decode().strip("=")
+
+
+def state_delta(delta: dict):
+    """Convert an algod `gd` global state delta to the indexer `global-state-delta` shape."""
+    return [
+        {
+            'key': b64(as_bytes(key)),
+            'value': {'action': value['at'], 'bytes': b64(as_bytes(value.get('bs', b''))), 'uint': value.get('ui', 0)}
+        }
+        for key, value in delta.items()
+    ]
+
+
+def to_indexer_transaction(stxn: dict, round_num: int, round_time: int):
+    """Reshape a signed transaction (or inner transaction) from an algod block like the indexer returns it."""
+    txn = stxn['txn']
+    apply_data = stxn.get('dt', {})
+    transaction = {
+        'sender': encoding.encode_address(txn['snd']),
+        'tx-type': txn['type'],
+        'confirmed-round': round_num,
+        'round-time': round_time,
+    }
+    if 'note' in txn:
+        transaction['note'] = b64(txn['note'])
+    if txn['type'] == 'pay':
+        transaction['payment-transaction'] = {
+            'receiver': encoding.encode_address(txn.get('rcv', bytes(32))),
+            'amount': txn.get('amt', 0),
+        }
+    elif txn['type'] == 'appl':
+        transaction['application-transaction'] = {
+            'application-id': txn.get('apid', 0),
+            'application-args': [b64(arg) for arg in txn.get('apaa', [])],
+        }
+        if 'apap' in txn:
+            transaction['application-transaction']['approval-program'] = b64(txn['apap'])
+        if 'apid' in stxn:
+            transaction['created-application-index'] = stxn['apid']
+    if 'gd' in apply_data:
+        transaction['global-state-delta'] = state_delta(apply_data['gd'])
+    if 'lg' in apply_data:
+        transaction['logs'] = [b64(as_bytes(log)) for log in apply_data['lg']]
+    if 'itx' in apply_data:
+        transaction['inner-txns'] = [to_indexer_transaction(inner, round_num, round_time) for inner in apply_data['itx']]
+    return transaction
+
+
+def pays_address(transaction: dict, address: str):
+    return any(
+        'payment-transaction' in inner and inner['payment-transaction']['receiver'] == address
+        for inner in transaction.get('inner-txns', [])
+    )
+
+
+def block_transactions(client: AlgodClient, round_num: int, address: str, state_cache=None):
+    """Return the app calls of a round whose inner payments go to `address`, in indexer shape.
+
+    Every app call of the round is passed to `state_cache.observe` when a cache is given, so
+    creation transactions seed it without a history lookup. Networks pass themselves, so their
+    program classifier sees the creations too.
+    """
+    raw = client.block_info(round_num=round_num, response_format='msgpack')
+    # state delta keys and values and logs are msgpack str holding arbitrary bytes, see as_bytes
+    block = msgpack.unpackb(raw, raw=False, strict_map_key=False, unicode_errors='surrogateescape')['block']
+    transactions = []
+    for stxn in block.get('txns', []):
+        txn = stxn['txn']
+        if txn['type'] != 'appl':
+            continue
+        transaction = to_indexer_transaction(stxn, block.get('rnd', 0), block.get('ts', 0))
+        if state_cache is not None:
+            state_cache.observe(transaction)
+        if pays_address(transaction, address):
+            if stxn.get('hgi'):
+                txn = dict(txn, gen=block['gen'])
+            txn = dict(txn, gh=block['gh'])
+            transaction['id'] = transaction_id(txn)
+            transactions.append(transaction)
+    return transactions
+
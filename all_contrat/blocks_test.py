@@ -0,0 +1,75 @@
+from base64 import b64encode
+
+import msgpack
+from algosdk import encoding
+
+from all_contrat import blocks
+from all_contrat.constants import FEES_ADDRESS
+from all_contrat.decoders import decode_transaction
+from all_contrat.indexer import Network
+from all_contrat.networks import PROFILES
+from all_contrat.fixtures import sample_context
+
+
+SELLER = bytes(range(32))
+
+
+def pay(receiver: str, amount: int, note: bytes = None):
+    txn = {'type': 'pay', 'snd': SELLER, 'rcv': encoding.decode_address(receiver), 'amt': amount}
+    if note is not None:
+        txn['note'] = note
+    return {'txn': txn}
+
+
+def test_block_transactions_decode_like_indexer(monkeypatch):
+    app_call = {
+        'txn': {'type': 'appl', 'snd': SELLER, 'apid': 42, 'apaa': [b'buy'], 'fee': 1000, 'fv': 1, 'lv': 2},
+        'hgi': True,
+        'dt': {'itx': [
+            pay(encoding.encode_address(SELLER), 900),
+            pay(encoding.encode_address(SELLER), 900),
+            pay(FEES_ADDRESS, 100, b'sale,buy,1/72'),
+        ]},
+    }
+    other_call = {'txn': {'type': 'appl', 'snd': SELLER, 'apid': 43}}
+    block = {'block': {'rnd': 7, 'ts': 1700000000, 'gen': 'voitest-v1', 'gh': bytes(32),
+                       'txns': [app_call, other_call, pay(FEES_ADDRESS, 5)]}}
+    client = Network(PROFILES['voi:testnet']).client
+    monkeypatch.setattr(client, 'block_info',
+                        lambda round_num, response_format: msgpack.packb(block, use_bin_type=True))
+
+    transactions = blocks.block_transactions(client, 7, FEES_ADDRESS)
+    assert len(transactions) == 1
+    event = decode_transaction(transactions[0], sample_context())
+    assert event.type == 'buy'
+    assert event.amount == 900
+    assert event.app_id == 42
+    assert event.round == 7
+    assert event.from_address == encoding.encode_address(SELLER)
+
+
+def test_block_state_delta_and_logs_hold_binary_strings(monkeypatch):
+    bidder = bytes([0xff]) + bytes(range(1, 32))
+    log = b'arc200_Transfer(' + bidder + b',' + SELLER + b',' + (40).to_bytes(8, 'big') + b')'
+    # algod encodes global state keys, byte values and logs as msgpack str, whatever their content
+    as_str = lambda value: value.decode('utf-8', 'surrogateescape')
+    app_call = {
+        'txn': {'type': 'appl', 'snd': SELLER, 'apid': 42, 'apaa': [b'bid']},
+        'dt': {
+            'gd': {as_str(b'bid_account'): {'at': 1, 'bs': as_str(bidder)}, as_str(b'bid_amount'): {'at': 2, 'ui': 7}},
+            'lg': [as_str(log)],
+            'itx': [pay(FEES_ADDRESS, 0, b'auction,bid,1/72')],
+        },
+    }
+    block = {'block': {'rnd': 7, 'ts': 1700000000, 'gen': 'voitest-v1', 'gh': bytes(32), 'txns': [app_call]}}
+    raw = msgpack.Packer(use_bin_type=True, unicode_errors='surrogateescape').pack(block)
+    client = Network(PROFILES['voi:testnet']).client
+    monkeypatch.setattr(client, 'block_info', lambda round_num, response_format: raw)
+
+    transaction, = blocks.block_transactions(client, 7, FEES_ADDRESS)
+    assert transaction['logs'] == [b64encode(log).decode()]
+    assert {'key': b64encode(b'bid_account').decode(),
+            'value': {'action': 1, 'bytes': b64encode(bidder).decode(), 'uint': 0}} in transaction['global-state-delta']
+    event = decode_transaction(transaction, sample_context())
+    assert event.amount == 7
+    assert event.from_address == encoding.encode_address(bidder)
@@ -0,0 +1,146 @@
+import asyncio
+
+from all_contrat.events import Action, MarketEvent
+from all_contrat.sinks import Sink
+
+
+DROP_OLDEST = 'drop-oldest'
+BLOCK = 'block'
+CLOSED = None
+
+
+class Subscription:
+    """Bounded queue of the events matching one subscriber's filters.
+
+    Filters left as None match everything. When the queue is full a `drop-oldest` subscription
+    discards its oldest event (counted in `dropped`), a `block` subscription makes the publisher
+    wait until the subscriber catches up. A `block` subscriber that does not catch up within
+    `timeout` seconds, or whose queue fills through the synchronous `write`, which cannot wait, is
+    disconnected instead of losing events: its iteration ends once the queue is drained and
+    `disconnected` is set. Iterate with `async for` until the bus closes.
+    """
+
+    def __init__(self, bus, maxsize: int, policy: str, app_ids=None, nft_app_ids=None, addresses=None, types=None,
+                 timeout: float = None):
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.bus = bus
+        self.queue = asyncio.Queue(maxsize)
+        self.policy = policy
+        self.app_ids = frozenset(app_ids) if app_ids is not None else None
+        self.nft_app_ids = frozenset(nft_app_ids) if nft_app_ids is not None else None
+        self.addresses = frozenset(addresses) if addresses is not None else None
+        self.types = frozenset(Action(action) for action in types) if types is not None else None
+        self.timeout = timeout
+        self.dropped = 0
+        self.closed = False
+        self.disconnected = False
+
+    def matches(self, event: MarketEvent, nft_app_id):
+        return (
+            (self.app_ids is None or event.app_id in self.app_ids)
+            and (self.nft_app_ids is None or nft_app_id in self.nft_app_ids)
+            and (self.addresses is None or event.from_address in self.addresses)
+            and (self.types is None or event.type in self.types)
+        )
+
+    def put_nowait(self, item):
+        if self.queue.full():
+            if self.policy == BLOCK:
+                self.disconnect()
+                return
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+    async def put(self, event: MarketEvent):
+        if self.policy == BLOCK:
+            try:
+                await asyncio.wait_for(self.queue.put(event), self.timeout)
+            except asyncio.TimeoutError:
+                self.disconnect()
+        else:
+            self.put_nowait(event)
+
+    def disconnect(self):
+        self.disconnected = True
+        self.bus.unsubscribe(self)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self.queue.empty():
+            raise StopAsyncIteration
+        event = await self.queue.get()
+        if event is CLOSED:
+            raise StopAsyncIteration
+        return event
+
+
+class EventBus(Sink):
+    """Broadcasts the decoded events of one stream to any number of in-process subscribers.
+
+    Used as (or teed into) the sink of a pipeline or follow run, so consumers share one indexer scan.
+    Only creation events carry the collection, so the bus remembers the collection of every app it
+    saw created, until the app is bought, closed or cancelled, and matches later events of that app on it.
+    """
+
+    def __init__(self):
+        self.subscriptions = []
+        self.collections = dict()
+
+    def subscribe(self, maxsize: int = 1000, policy: str = DROP_OLDEST, app_ids=None, nft_app_ids=None,
+                  addresses=None, types=None, timeout: float = 30.0):
+        """Register a subscriber and return its Subscription.
+
+        Args:
+            maxsize: Number of events the subscriber's queue holds.
+            policy: 'drop-oldest' or 'block', what to do when the queue is full.
+            app_ids: Marketplace app ids to receive.
+            nft_app_ids: Collections (ARC72 app ids) to receive.
+            addresses: Event addresses (seller, buyer or bidder) to receive.
+            types: Event types to receive, e.g. ('buy', 'bid').
+            timeout: Seconds the publisher waits on a full 'block' queue before disconnecting the
+                subscriber, None to wait forever.
+        """
+        subscription = Subscription(self, maxsize, policy, app_ids, nft_app_ids, addresses, types, timeout)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+            subscription.closed = True
+            # wakes a waiting subscriber, one that is behind stops once its queue is drained
+            if not subscription.queue.full():
+                subscription.queue.put_nowait(CLOSED)
+
+    def _collection(self, event: MarketEvent):
+        if event.type in (Action.BUY, Action.CLOSE, Action.CANCEL):
+            # the app's last event, nothing will be matched on its collection anymore
+            return self.collections.pop(event.app_id, event.nft_app_id)
+        if event.nft_app_id is not None:
+            self.collections[event.app_id] = event.nft_app_id
+            return event.nft_app_id
+        return self.collections.get(event.app_id)
+
+    def write(self, event: MarketEvent):
+        nft_app_id = self._collection(event)
+        # a disconnected subscriber leaves the list while it is iterated
+        for subscription in list(self.subscriptions):
+            if subscription.matches(event, nft_app_id):
+                subscription.put_nowait(event)
+
+    async def publish(self, event: MarketEvent):
+        nft_app_id = self._collection(event)
+        for subscription in list(self.subscriptions):
+            if subscription.matches(event, nft_app_id):
+                await subscription.put(event)
+
+    def close(self):
+        for subscription in list(self.subscriptions):
+            subscription.close()
@@ -0,0 +1,60 @@
+import asyncio
+
+from all_contrat.fixtures import sample_transaction, sample_context
+from all_contrat.bus import EventBus, BLOCK
+from all_contrat.decoders import decode_transaction
+
+
+def event(note: str, index: int = 0):
+    return decode_transaction(sample_transaction(note, index), sample_context())
+
+
+def test_filters_and_drop_oldest():
+    async def run():
+        bus = EventBus()
+        buys = bus.subscribe(maxsize=2, types=['buy'])
+        collection = bus.subscribe(nft_app_ids=[event('sale,create,1/72').nft_app_id], app_ids=[1000])
+        for note in ('sale,create,1/72', 'sale,update,1/72', 'sale,buy,1/72', 'sale,buy,1/72', 'sale,buy,1/72'):
+            await bus.publish(event(note))
+        await bus.publish(event('sale,buy,1/72', index=1))
+        bus.close()
+        return bus, [e.app_id async for e in buys], buys.dropped, [e.type.value async for e in collection]
+
+    bus, buys, dropped, collection = asyncio.run(run())
+    assert buys == [1000, 1001]
+    assert dropped == 2
+    # the collection of an app is forgotten once it is bought
+    assert collection == ['create', 'update', 'buy']
+    assert bus.collections == {}
+
+
+def test_block_policy_waits_for_the_subscriber():
+    async def run():
+        bus = EventBus()
+        subscription = bus.subscribe(maxsize=1, policy=BLOCK)
+        await bus.publish(event('sale,buy,1/72', 0))
+        publish = asyncio.ensure_future(bus.publish(event('sale,buy,1/72', 1)))
+        await asyncio.sleep(0)
+        waiting = not publish.done()
+        first = await subscription.__anext__()
+        await publish
+        return waiting, first.app_id, (await subscription.__anext__()).app_id
+
+    assert asyncio.run(run()) == (True, 1000, 1001)
+
+
+def test_block_subscriber_is_disconnected_rather_than_losing_events():
+    async def run():
+        bus = EventBus()
+        stalled = bus.subscribe(maxsize=1, policy=BLOCK, timeout=0.01)
+        await bus.publish(event('sale,buy,1/72', 0))
+        # the subscriber stopped consuming, the publisher gives up on it instead of hanging
+        await bus.publish(event('sale,buy,1/72', 1))
+        synchronous = bus.subscribe(maxsize=1, policy=BLOCK)
+        # write cannot wait for the subscriber
+        bus.write(event('sale,buy,1/72', 2))
+        bus.write(event('sale,buy,1/72', 3))
+        return ([e.app_id async for e in stalled], stalled.disconnected,
+                [e.app_id async for e in synchronous], synchronous.disconnected, bus.subscriptions)
+
+    assert asyncio.run(run()) == ([1000], True, [1002], True, [])
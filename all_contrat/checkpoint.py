@@ -0,0 +1,39 @@
+class Checkpoint:
+    """Durable cursor of an indexing run, stored in the SQLite database of the events it covers.
+
+    The cursor holds the scan's round range, the token of the page to fetch next (the first round
+    of the next window, see Network.fetch_page) and the last round that was fully processed. `save` does not commit: the sink owning the
+    connection commits the cursor in the same transaction as the events of the page it follows,
+    so after a crash the two always agree and the run resumes at the page that was in flight.
+    """
+
+    def __init__(self, connection, name: str = 'voi:testnet'):
+        self.name = name
+        self.connection = connection
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS cursor ('
+                'name TEXT PRIMARY KEY, round INTEGER, min_round INTEGER, max_round INTEGER, next_token TEXT)'
+            )
+
+    def load(self):
+        """Return (round, min_round, max_round, next_token) of the last commit, or None."""
+        return self.connection.execute(
+            'SELECT round, min_round, max_round, next_token FROM cursor WHERE name = ?', (self.name,)
+        ).fetchone()
+
+    def resume(self, min_round: int, max_round: int):
+        """Return the (min_round, next_token) to continue a scan of [min_round, max_round] from."""
+        saved = self.load()
+        if saved is None:
+            return min_round, None
+        round_num, saved_min_round, saved_max_round, next_token = saved
+        if next_token is not None and saved_max_round == max_round:
+            return saved_min_round, next_token
+        return max(min_round, round_num + 1), None
+
+    def save(self, round_num: int, min_round: int, max_round: int, next_token: str = None):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO cursor (name, round, min_round, max_round, next_token) VALUES (?, ?, ?, ?, ?)',
+            (self.name, round_num, min_round, max_round, next_token)
+        )
@@ -0,0 +1,370 @@
+from base64 import b64decode, b64encode
+from typing import NamedTuple, Optional
+
+from algosdk.encoding import encode_address
+
+from all_contrat import metrics
+from all_contrat.events import Action, Kind, Market, new_market_event
+
+
+DECODERS = dict()
+
+
+class DecodeContext:
+    """What a decoder may need beyond the transaction itself."""
+
+    def __init__(self, chain: str, fees_address: str, global_state, classify=None):
+        self.chain = chain
+        self.fees_address = fees_address
+        # global_state(app_id, round) -> dict of global state keys to values
+        self.global_state = global_state
+        # classify(app_id) -> (Kind, Market) of the contract an app runs, or None; notes are trusted when unset
+        self.classify = classify
+        # app_id -> DutchParams of the dutch auctions created while indexing
+        self.dutch_auctions = dict()
+
+
+def register(*keys):
+    """Register a decoder for one or more (type, action, currency) note keys.
+
+    A decoder is called as decoder(transaction, note, context) and returns a MarketEvent, or None
+    through skip when the transaction lacks the transfers or state its note implies.
+    """
+    def wrapper(decoder):
+        for key in keys:
+            DECODERS[key] = decoder
+        return decoder
+    return wrapper
+
+
+def split_note(note: str):
+    """Return the (type, action, currency) key of a fee note, or None when the note has fewer fields."""
+    fields = note.split(",")
+    if len(fields) < 3:
+        return None
+    type_tx, action_tx, currency_tx = fields[:3]
+    return type_tx, action_tx, currency_tx
+
+
+def fee_payment(transaction, fees_address: str):
+    """Return the amount of the inner payment carrying the fee note, or None."""
+    for inner_txn in transaction.get('inner-txns', []):
+        if 'note' in inner_txn and inner_txn.get('payment-transaction', {}).get('receiver') == fees_address:
+            return inner_txn['payment-transaction']['amount']
+    return None
+
+
+def fee_note(transaction, fees_address: str):
+    """Return the note of the single inner payment to the fees address, or None.
+
+    Anyone can pay the fees address, so notes that are not base64 ASCII are not events either.
+    """
+    inner_txns = [tx for tx in transaction['inner-txns']
+                  if 'note' in tx and 'tx-type' in tx and tx.get('payment-transaction', {}).get('receiver') == fees_address]
+    if len(inner_txns) != 1:
+        return None
+    try:
+        return b64decode(inner_txns[0]['note']).decode('ascii')
+    except ValueError:
+        # binascii.Error and UnicodeDecodeError both derive from ValueError
+        return None
+
+
+def dispatch(transaction, context: DecodeContext):
+    """Return the (decoder, note) pair for a fee address transaction, or None when it carries no event.
+
+    Only the note is looked at, so dispatch never blocks; checking the app's program is left to
+    decode_dispatched.
+    """
+    if 'application-transaction' not in transaction or 'inner-txns' not in transaction:
+        return None
+    note = fee_note(transaction, context.fees_address)
+    if note is None:
+        return None
+    key = split_note(note)
+    if key is None:
+        return None
+    decoder = DECODERS.get(key)
+    if decoder is None:
+        return None
+    return decoder, note
+
+
+def decode_dispatched(transaction, dispatched, context: DecodeContext):
+    """Run the decoder of a (decoder, note) pair returned by dispatch.
+
+    With a classifier in the context, apps whose approval program is not the contract the note
+    claims return None, so a lookalike note sent by another app is not decoded. Classifying may
+    fetch the program, like decoders may fetch state, so pipelines call this in their executor.
+    """
+    decoder, note = dispatched
+    if context.classify is not None:
+        kind, _, market = split_note(note)
+        variant = context.classify(transaction['application-transaction']['application-id'])
+        if variant is None or variant != (KIND_BY_NAME[kind], MARKET_BY_NAME[market]):
+            return None
+    return decoder(transaction, note, context)
+
+
+def decode_transaction(transaction, context: DecodeContext):
+    """Return the marketplace event carried by one fee address transaction, or None."""
+    dispatched = dispatch(transaction, context)
+    if dispatched is None:
+        return None
+    return decode_dispatched(transaction, dispatched, context)
+
+
+def skip(transaction, note, context):
+    """Count an app call whose note names a decoder but whose transaction does not fit it, and return None.
+
+    Anyone can pay the fees address with a marketplace note, so such calls are not errors.
+    """
+    metrics.SKIPPED.inc(chain=context.chain, note=note)
+    return None
+
+
+KIND_BY_NAME = {kind.value: kind for kind in Kind}
+MARKET_BY_NAME = {market.value: market for market in Market}
+
+
+def new_event(transaction, note, context, action: Action, amount, currency, nft_app_id=None, nft_id=None, end=None,
+              from_address=None):
+    kind, _, market = split_note(note)
+    return new_market_event(
+        transaction['id'],
+        transaction['confirmed-round'],
+        transaction['round-time'],
+        from_address or transaction['sender'],
+        context.chain,
+        transaction['application-transaction']['application-id'],
+        KIND_BY_NAME[kind],
+        action,
+        MARKET_BY_NAME[market],
+        amount,
+        currency,
+        nft_app_id,
+        nft_id,
+        end,
+        fee_payment(transaction, context.fees_address),
+    )
+
+
+def app_arg_int(transaction, index: int):
+    return int.from_bytes(b64decode(transaction['application-transaction']['application-args'][index]), byteorder='big')
+
+
+def app_state(transaction, context):
+    return context.global_state(transaction['application-transaction']['application-id'], transaction['confirmed-round'])
+
+
+def state_delta_value(transaction, key: bytes):
+    """Return the value a transaction wrote to a global state key, or None."""
+    for pair in transaction.get('global-state-delta', []):
+        if b64decode(pair['key']) == key:
+            value = pair['value']
+            if value['action'] == 1:
+                return b64decode(value.get('bytes', ''))
+            if value['action'] == 2:
+                return value.get('uint', 0)
+    return None
+
+
+ARC200_TRANSFER = bytes.fromhex('da7025b9')
+ARC72_TRANSFER_FROM = bytes.fromhex('f2f194a0')
+ARC200_TRANSFER_LOG = b'arc200_Transfer('
+
+
+class Transfer(NamedTuple):
+    app_id: int
+    sender: Optional[bytes]
+    receiver: bytes
+    amount: int
+
+
+def inner_calls(transaction, selector: bytes):
+    """Yield the inner app calls whose first argument is `selector`, wherever they sit."""
+    # compare the base64 form to avoid decoding every argument
+    encoded = b64encode(selector).decode()
+    for inner_txn in transaction.get('inner-txns', []):
+        call = inner_txn.get('application-transaction')
+        if call is not None and call['application-args'] and call['application-args'][0] == encoded:
+            yield inner_txn
+
+
+def parse_arc200_transfer_log(log: bytes):
+    """Return (sender, receiver, amount) of an `arc200_Transfer(from,to,amount)` log, or None."""
+    if not log.startswith(ARC200_TRANSFER_LOG) or len(log) < 83:
+        return None
+    start = len(ARC200_TRANSFER_LOG)
+    return log[start:start + 32], log[start + 33:start + 65], int.from_bytes(log[start + 66:-1], byteorder='big')
+
+
+def arc200_transfers(transaction):
+    """Return the ARC200 transfers made by a transaction's inner calls, in order.
+
+    Amounts come from the ARC200 app's `arc200_Transfer(` log when there is one, so they are what
+    was actually moved, and from the call arguments otherwise.
+    """
+    transfers = []
+    for inner_txn in inner_calls(transaction, ARC200_TRANSFER):
+        call = inner_txn['application-transaction']
+        logs = [parsed for parsed in (parse_arc200_transfer_log(b64decode(log)) for log in inner_txn.get('logs', []))
+                if parsed is not None]
+        if logs:
+            sender, receiver, amount = logs[0]
+        else:
+            args = call['application-args']
+            sender = None
+            receiver = b64decode(args[1])
+            amount = int.from_bytes(b64decode(args[2]), byteorder='big')
+        transfers.append(Transfer(call['application-id'], sender, receiver, amount))
+    return transfers
+
+
+def arc72_transfers(transaction):
+    """Return the ARC72 transferFrom calls of a transaction, the amount being the token id."""
+    transfers = []
+    for inner_txn in inner_calls(transaction, ARC72_TRANSFER_FROM):
+        call = inner_txn['application-transaction']
+        args = [b64decode(arg) for arg in call['application-args']]
+        transfers.append(Transfer(call['application-id'], args[1], args[2], int.from_bytes(args[3], byteorder='big')))
+    return transfers
+
+
+def seller_payment(transaction, fees_address: str):
+    """Return the amount of the first inner VOI payment that is not the fee, i.e. the one to the seller."""
+    for inner_txn in transaction.get('inner-txns', []):
+        payment = inner_txn.get('payment-transaction')
+        if payment is not None and payment['amount'] > 0 and payment['receiver'] != fees_address:
+            return payment['amount']
+    return None
+
+
+class DutchParams(NamedTuple):
+    max_price: int
+    min_price: int
+    start: int
+    end: int
+
+
+def dutch_price(params: DutchParams, timestamp: int):
+    """Price of a dutch auction at `timestamp`, with the integer formula of the dutch contracts' on_buy.
+
+    The timestamp is clamped to [start, end], so the price stays within [min_price, max_price]
+    before the auction starts and after it ends.
+    """
+    timestamp = min(max(timestamp, params.start), params.end)
+    return params.max_price - (params.max_price - params.min_price) * (timestamp - params.start) // (params.end - params.start)
+
+
+def dutch_params(state: dict):
+    """Return the DutchParams in an app's global state, or None when one of them is missing."""
+    values = [state.get(key) for key in (b'max_price', b'min_price', b'start', b'end')]
+    if None in values:
+        return None
+    return DutchParams(*values)
+
+
+LISTINGS = (('sale', '1/72'), ('sale', '200/72'), ('sale', '1/rwa'), ('sale', '200/rwa'),
+            ('dutch', '1/72'), ('dutch', '200/72'))
+AUCTIONS = (('auction', '1/72'), ('auction', '200/72'))
+
+
+@register(*[(type_tx, action_tx, currency_tx)
+            for type_tx, currency_tx in LISTINGS + AUCTIONS
+            for action_tx in ('fund', 'create')])
+def decode_create(transaction, note, context):
+    state = app_state(transaction, context)
+    # sales list at `price`, dutch auctions start at `max_price`, english auctions at `min_price`
+    price = state.get(b'price', state.get(b'max_price', state.get(b'min_price')))
+    nft_id = state.get(b'nft_id')
+    if isinstance(nft_id, bytes):
+        nft_id = int.from_bytes(nft_id, byteorder='big')
+    kind = split_note(note)[0]
+    end = state.get(b'end') if kind == 'auction' else None
+    params = dutch_params(state) if kind == 'dutch' else None
+    if params is not None:
+        context.dutch_auctions[transaction['application-transaction']['application-id']] = params
+    return new_event(transaction, note, context, Action.CREATE, price, state.get(b'arc200_app_id', 0),
+                     state.get(b'nft_app_id'), nft_id, end)
+
+
+@register(('sale', 'update', '1/72'), ('sale', 'update', '1/rwa'))
+def decode_update_voi(transaction, note, context):
+    if len(transaction['application-transaction'].get('application-args', [])) < 2:
+        return skip(transaction, note, context)
+    return new_event(transaction, note, context, Action.UPDATE, app_arg_int(transaction, 1), 0)
+
+
+@register(('sale', 'update', '200/72'), ('sale', 'update', '200/rwa'))
+def decode_update_arc200(transaction, note, context):
+    currency = app_state(transaction, context).get(b'arc200_app_id')
+    if currency is None or len(transaction['application-transaction'].get('application-args', [])) < 2:
+        return skip(transaction, note, context)
+    return new_event(transaction, note, context, Action.UPDATE, app_arg_int(transaction, 1), currency)
+
+
+@register(('sale', 'buy', '1/72'), ('sale', 'buy', '1/rwa'), ('dutch', 'buy', '1/72'))
+def decode_buy_voi(transaction, note, context):
+    context.dutch_auctions.pop(transaction['application-transaction']['application-id'], None)
+    return new_event(transaction, note, context, Action.BUY, seller_payment(transaction, context.fees_address), 0)
+
+
+@register(('sale', 'buy', '200/72'), ('sale', 'buy', '200/rwa'))
+def decode_buy_arc200(transaction, note, context):
+    transfers = arc200_transfers(transaction)
+    if not transfers:
+        return skip(transaction, note, context)
+    return new_event(transaction, note, context, Action.BUY, transfers[-1].amount, transfers[-1].app_id)
+
+
+@register(('dutch', 'buy', '200/72'))
+def decode_dutch_buy_arc200(transaction, note, context):
+    # like the other buys, report what the seller was actually transferred, not the gross dutch_price
+    context.dutch_auctions.pop(transaction['application-transaction']['application-id'], None)
+    transfers = arc200_transfers(transaction)
+    if not transfers:
+        return skip(transaction, note, context)
+    return new_event(transaction, note, context, Action.BUY, transfers[-1].amount, transfers[-1].app_id)
+
+
+@register(('auction', 'bid', '1/72'), ('auction', 'bid', '200/72'))
+def decode_bid(transaction, note, context):
+    # the bid is recorded in the app's state delta, for VOI bids it is not even an app argument
+    amount = state_delta_value(transaction, b'bid_amount')
+    bidder = state_delta_value(transaction, b'bid_account')
+    currency = 0
+    if note.endswith('200/72'):
+        # only a bid that outbids someone refunds them through the ARC200 app
+        transfers = arc200_transfers(transaction)
+        currency = transfers[0].app_id if transfers else app_state(transaction, context).get(b'arc200_app_id')
+        if currency is None:
+            return skip(transaction, note, context)
+    return new_event(transaction, note, context, Action.BID, amount, currency,
+                     from_address=encode_address(bidder) if bidder is not None else None)
+
+
+@register(('auction', 'close', '1/72'), ('auction', 'close', '200/72'))
+def decode_auction_close(transaction, note, context):
+    nft_transfers = arc72_transfers(transaction)
+    if note.endswith('200/72'):
+        transfers = arc200_transfers(transaction)
+        if not transfers:
+            return skip(transaction, note, context)
+        amount, currency = transfers[-1].amount, transfers[-1].app_id
+    else:
+        amount, currency = seller_payment(transaction, context.fees_address), 0
+    if not nft_transfers:
+        return skip(transaction, note, context)
+    # the winner, not whoever sent the close call, is the buyer
+    winner = nft_transfers[0].receiver
+    return new_event(transaction, note, context, Action.CLOSE, amount, currency, from_address=encode_address(winner))
+
+
+@register(*[(type_tx, action_tx, currency_tx)
+            for type_tx, currency_tx in LISTINGS + AUCTIONS
+            for action_tx in ('close', 'cancel')
+            if (type_tx, action_tx) != ('auction', 'close')])
+def decode_cancel(transaction, note, context):
+    context.dutch_auctions.pop(transaction['application-transaction']['application-id'], None)
+    return new_event(transaction, note, context, Action.CANCEL, None, None)
@@ -0,0 +1,111 @@
+from base64 import b64encode
+
+from algosdk.encoding import encode_address
+
+from all_contrat.fixtures import sample_transaction, sample_context, ARC200_APP_ID
+from all_contrat.decoders import DutchParams, decode_transaction, dutch_price
+
+
+def test_decode_sale_buy_voi():
+    event = decode_transaction(sample_transaction('sale,buy,1/72', price=5_000_000), sample_context())
+    assert event.type == 'buy'
+    assert event.amount == 5_000_000
+    assert event.currency == 0
+
+
+def test_decode_sale_buy_arc200():
+    event = decode_transaction(sample_transaction('sale,buy,200/72', price=42), sample_context())
+    assert event.type == 'buy'
+    assert event.amount == 42
+    assert event.currency == ARC200_APP_ID
+
+
+def test_decode_rwa_buy_arc200_is_a_buy():
+    event = decode_transaction(sample_transaction('sale,buy,200/rwa', price=42), sample_context())
+    assert event.type == 'buy'
+
+
+def test_decode_cancel_aliases():
+    for note in ('sale,close,1/72', 'sale,cancel,1/72', 'dutch,cancel,200/72'):
+        event = decode_transaction(sample_transaction(note), sample_context())
+        assert event.type == 'cancel'
+        assert event.amount is None
+
+
+def test_decode_unknown_note():
+    assert decode_transaction(sample_transaction('raffle,buy,1/72'), sample_context()) is None
+
+
+def test_decode_arbitrary_payments_to_fees_address():
+    for note in ('hello', 'sale,buy'):
+        assert decode_transaction(sample_transaction(note), sample_context()) is None
+    transaction = sample_transaction('sale,buy,1/72')
+    transaction['inner-txns'][-1]['note'] = b64encode('sälé,buy,1/72'.encode()).decode()
+    assert decode_transaction(transaction, sample_context()) is None
+    # an inner app call with a note has no payment fields
+    transaction = sample_transaction('sale,buy,1/72')
+    transaction['inner-txns'].append({'tx-type': 'appl', 'note': b64encode(b'hello').decode(),
+                                      'application-transaction': {'application-id': 1}})
+    assert decode_transaction(transaction, sample_context()).type == 'buy'
+
+
+def test_decode_skips_app_calls_without_the_implied_transfers_or_state():
+    for note in ('sale,buy,200/72', 'dutch,buy,200/72', 'auction,close,200/72', 'auction,close,1/72'):
+        transaction = sample_transaction(note)
+        # only the fee payment is left
+        transaction['inner-txns'] = transaction['inner-txns'][-1:]
+        assert decode_transaction(transaction, sample_context()) is None
+    context = sample_context()
+    context.global_state(0, 0).clear()
+    assert decode_transaction(sample_transaction('sale,update,200/72'), context) is None
+
+
+def test_decode_auction_bid_from_state_delta():
+    transaction = sample_transaction('auction,bid,1/72')
+    transaction['global-state-delta'] = [
+        {'key': b64encode(b'bid_amount').decode(), 'value': {'action': 2, 'uint': 123}},
+        {'key': b64encode(b'bid_account').decode(), 'value': {'action': 1, 'bytes': b64encode(bytes(32)).decode()}},
+    ]
+    event = decode_transaction(transaction, sample_context())
+    assert event.type == 'bid'
+    assert event.amount == 123
+    assert event.from_address == encode_address(bytes(32))
+
+
+def test_arc200_amount_found_by_selector_and_log():
+    transaction = sample_transaction('sale,buy,200/72', price=42)
+    transaction['inner-txns'].reverse()
+    transfer_log = b'arc200_Transfer(' + bytes(32) + b',' + bytes(32) + b',' + (40).to_bytes(8, 'big') + b')'
+    for inner_txn in transaction['inner-txns']:
+        if inner_txn['tx-type'] == 'appl':
+            inner_txn['logs'] = [b64encode(transfer_log).decode()]
+    event = decode_transaction(transaction, sample_context())
+    assert event.amount == 40
+    assert event.currency == ARC200_APP_ID
+
+
+def test_decode_auction_close_winner_from_arc72_transfer():
+    event = decode_transaction(sample_transaction('auction,close,200/72', price=500), sample_context())
+    assert event.type == 'close'
+    assert event.amount == 500
+    assert event.from_address == encode_address(bytes(31) + b'\x01')
+
+
+def test_dutch_buy_reports_the_amount_transferred():
+    context = sample_context()
+    context.global_state(0, 0).pop(b'price')
+    decode_transaction(sample_transaction('dutch,create,200/72', index=0), context)
+    assert 1000 in context.dutch_auctions
+    # the formula price at round-time 1700000000 would be 1_500_000, gross of fees
+    event = decode_transaction(sample_transaction('dutch,buy,200/72', index=0, price=1_425_000), context)
+    assert event.amount == 1_425_000
+    assert event.currency == ARC200_APP_ID
+    assert 1000 not in context.dutch_auctions
+
+
+def test_dutch_price_stays_within_min_and_max():
+    params = DutchParams(2_000_000, 1_000_000, 1000, 2000)
+    assert dutch_price(params, 1500) == 1_500_000
+    # round times may fall outside [start, end], the contract never sells outside the price range
+    assert dutch_price(params, 2600) == 1_000_000
+    assert dutch_price(params, 900) == 2_000_000
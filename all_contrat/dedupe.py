@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from math import ceil, log
+
+
+class BloomFilter:
+    """Set membership with false positives but no false negatives, in about 10 bits per key at 1%.
+
+    Args:
+        capacity: Number of keys the filter is sized for.
+        error_rate: False positive rate once `capacity` keys were added.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, ceil(-capacity * log(error_rate) / log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        # double hashing, the k positions derive from two 64 bit halves of one digest
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class Deduplicator:
+    """Admits each transaction id once, across restarts, overlapping shards and follow mode.
+
+    The bloom filter is loaded with every id the sink already holds. An id it has never seen is
+    new for sure and admitted without touching the sink; only bloom hits, i.e. duplicates and the
+    rare false positives, are checked against the ids admitted recently, which may still be on
+    their way to the sink, and then against the sink's durable id index.
+
+    Args:
+        sink: Sink whose `ids` seed the filter and whose `seen` settles bloom hits.
+        capacity: Number of events the filter is sized for, the whole expected history.
+        error_rate: False positive rate of the filter at capacity.
+        in_flight: Number of recently admitted ids remembered, more than a pipeline holds in its queues.
+    """
+
+    def __init__(self, sink, capacity: int = 10_000_000, error_rate: float = 0.01, in_flight: int = 100_000):
+        self.sink = sink
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.recent = OrderedDict()
+        self.in_flight = in_flight
+        self.duplicates = 0
+        for tx_id in sink.ids():
+            self.bloom.add(tx_id)
+
+    def admit(self, tx_id: str):
+        """Return True the first time an id is seen, False for duplicates."""
+        if tx_id not in self.bloom:
+            self.bloom.add(tx_id)
+        elif tx_id in self.recent or self.sink.seen(tx_id):
+            self.duplicates += 1
+            return False
+        self.recent[tx_id] = None
+        if len(self.recent) > self.in_flight:
+            self.recent.popitem(last=False)
+        return True
@@ -0,0 +1,38 @@
+import asyncio
+
+from all_contrat import pipeline
+from all_contrat.fixtures import sample_transactions
+from all_contrat.dedupe import BloomFilter, Deduplicator
+from all_contrat.pipeline_test import sample_network
+from all_contrat.sinks import SqliteSink
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add('TX%d' % i)
+    assert all('TX%d' % i in bloom for i in range(1000))
+    assert sum('OTHER%d' % i in bloom for i in range(10_000)) < 300
+
+
+def test_duplicates_are_dropped_across_runs_and_pages(tmp_path):
+    transactions = sample_transactions(300)
+    # the second page repeats the end of the first one
+    pages = [transactions[:200], transactions[150:]]
+    network = sample_network(lambda address, min_round, max_round, next_page: (
+        pages[int(next_page or 0)], '1' if not next_page else None))
+    path = str(tmp_path / 'indexer.sqlite')
+
+    sink = SqliteSink(path, flush_interval=0)
+    dedupe = Deduplicator(sink, capacity=1000)
+    asyncio.run(pipeline.run_pipeline(1, 2, sink=sink, network=network, dedupe=dedupe))
+    assert dedupe.duplicates == 50
+    assert sum(row[4] for row in sink.fees.totals()) == 300
+
+    # a second run over the same range, as after an overlapping restart
+    sink.connection.execute('DELETE FROM cursor')
+    dedupe = Deduplicator(sink, capacity=1000)
+    asyncio.run(pipeline.run_pipeline(1, 2, sink=sink, network=network, dedupe=dedupe))
+    assert dedupe.duplicates == 350
+    assert sum(row[4] for row in sink.fees.totals()) == 300
+    sink.close()
@@ -0,0 +1,159 @@
+from array import array
+from enum import Enum
+from sys import intern
+from typing import NamedTuple, Optional
+
+
+class Kind(str, Enum):
+    """Contract family, first field of the fee note."""
+    SALE = 'sale'
+    DUTCH = 'dutch'
+    AUCTION = 'auction'
+
+
+class Action(str, Enum):
+    """What happened to the listing, the `type` of an event."""
+    CREATE = 'create'
+    UPDATE = 'update'
+    BUY = 'buy'
+    CANCEL = 'cancel'
+    BID = 'bid'
+    CLOSE = 'close'
+
+
+class Market(str, Enum):
+    """Currency / asset pair, last field of the fee note."""
+    VOI_ARC72 = '1/72'
+    ARC200_ARC72 = '200/72'
+    VOI_RWA = '1/rwa'
+    ARC200_RWA = '200/rwa'
+
+
+KINDS = list(Kind)
+ACTIONS = list(Action)
+MARKETS = list(Market)
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+MARKET_CODES = {market: code for code, market in enumerate(MARKETS)}
+
+
+class MarketEvent(NamedTuple):
+    """One decoded marketplace event.
+
+    `amount` is None when the event carries no price, `currency` is 0 for VOI and the ARC200
+    app id otherwise. `nft_app_id` and `nft_id` are only known on creation events, `end` only on
+    the creation of auctions. `fee` is the VOI amount the contract paid to the fees address.
+    """
+    id: str
+    round: int
+    created_at: int
+    from_address: str
+    chain: str
+    app_id: int
+    kind: Kind
+    type: Action
+    market: Market
+    amount: Optional[int]
+    currency: Optional[int]
+    nft_app_id: Optional[int] = None
+    nft_id: Optional[int] = None
+    end: Optional[int] = None
+    fee: Optional[int] = None
+
+    @property
+    def note(self):
+        return '%s,%s,%s' % (self.kind.value, self.type.value, self.market.value)
+
+    def as_dict(self):
+        event = self._asdict()
+        event['kind'] = self.kind.value
+        event['type'] = self.type.value
+        event['market'] = self.market.value
+        return event
+
+
+def new_market_event(tx_id: str, round_num: int, created_at: int, from_address: str, chain: str, app_id: int,
+                     kind: Kind, action: Action, market: Market, amount: Optional[int], currency: Optional[int],
+                     nft_app_id: Optional[int] = None, nft_id: Optional[int] = None, end: Optional[int] = None,
+                     fee: Optional[int] = None):
+    # addresses and chain tags repeat across events, interning keeps one copy of each
+    return MarketEvent(tx_id, round_num, created_at, intern(from_address), intern(chain), app_id,
+                       kind, action, market, amount, currency, nft_app_id, nft_id, end, fee)
+
+
+class EventBatch:
+    """Column oriented container of MarketEvents.
+
+    Integer fields live in typed arrays and enum fields as one byte codes, so a batch costs a few
+    dozen bytes per event and columns can be handed to array consumers without touching events.
+    Missing amounts, currencies and fees are stored as 0 with a mask, a missing end as 0; NFT ids, which may not fit 64 bits,
+    stay in a list.
+    """
+
+    def __init__(self, events=()):
+        self.id = []
+        self.from_address = []
+        self.chain = []
+        self.round = array('Q')
+        self.created_at = array('Q')
+        self.app_id = array('Q')
+        self.amount = array('Q')
+        self.currency = array('Q')
+        self.has_amount = bytearray()
+        self.has_currency = bytearray()
+        self.nft_app_id = []
+        self.nft_id = []
+        self.end = array('Q')
+        self.fee = array('Q')
+        self.has_fee = bytearray()
+        self.kind = bytearray()
+        self.type = bytearray()
+        self.market = bytearray()
+        for event in events:
+            self.append(event)
+
+    def __len__(self):
+        return len(self.id)
+
+    def append(self, event: MarketEvent):
+        self.id.append(event.id)
+        self.from_address.append(event.from_address)
+        self.chain.append(event.chain)
+        self.round.append(event.round)
+        self.created_at.append(event.created_at)
+        self.app_id.append(event.app_id)
+        self.amount.append(event.amount or 0)
+        self.has_amount.append(event.amount is not None)
+        self.currency.append(event.currency or 0)
+        self.has_currency.append(event.currency is not None)
+        self.nft_app_id.append(event.nft_app_id)
+        self.nft_id.append(event.nft_id)
+        self.end.append(event.end or 0)
+        self.fee.append(event.fee or 0)
+        self.has_fee.append(event.fee is not None)
+        self.kind.append(KIND_CODES[event.kind])
+        self.type.append(ACTION_CODES[event.type])
+        self.market.append(MARKET_CODES[event.market])
+
+    def __getitem__(self, i: int):
+        return MarketEvent(
+            self.id[i],
+            self.round[i],
+            self.created_at[i],
+            self.from_address[i],
+            self.chain[i],
+            self.app_id[i],
+            KINDS[self.kind[i]],
+            ACTIONS[self.type[i]],
+            MARKETS[self.market[i]],
+            self.amount[i] if self.has_amount[i] else None,
+            self.currency[i] if self.has_currency[i] else None,
+            self.nft_app_id[i],
+            self.nft_id[i],
+            self.end[i] or None,
+            self.fee[i] if self.has_fee[i] else None,
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -0,0 +1,12 @@
+from all_contrat.fixtures import sample_transactions, sample_context
+from all_contrat.decoders import decode_transaction
+from all_contrat.events import EventBatch
+
+
+def test_event_batch_round_trip():
+    context = sample_context()
+    events = [decode_transaction(transaction, context) for transaction in sample_transactions(100)]
+    batch = EventBatch(events)
+    assert len(batch) == 100
+    assert list(batch) == events
+    assert batch.amount[0] == (events[0].amount or 0)
@@ -0,0 +1,262 @@
+import os
+import re
+import sqlite3
+from time import monotonic
+from urllib.parse import quote
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from all_contrat.events import EventBatch, KINDS, MARKETS
+from all_contrat.fees import SECONDS_PER_DAY, day_name
+from all_contrat.sinks import Sink, EVENT_COLUMNS, row_event
+
+
+SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('round', pa.uint64()),
+    ('created_at', pa.timestamp('s', tz='UTC')),
+    ('app_id', pa.uint64()),
+    ('kind', pa.dictionary(pa.int8(), pa.string())),
+    ('market', pa.dictionary(pa.int8(), pa.string())),
+    ('amount', pa.uint64()),
+    ('currency', pa.uint64()),
+    ('from_address', pa.string()),
+    ('nft_app_id', pa.uint64()),
+    # NFT ids are uint256
+    ('nft_id', pa.string()),
+    ('ends_at', pa.timestamp('s', tz='UTC')),
+    ('fee', pa.uint64()),
+])
+
+
+# files starting with '_' or '.' are skipped by dataset readers
+CURSOR_FILE = '_cursor'
+PART_FILE = re.compile(r'part-(\d+)-(\d+)-.*\.parquet')
+
+
+def chain_path(root: str, chain: str):
+    # ':' is not allowed in Windows paths, hive readers decode the escaped value back to the chain name
+    return os.path.join(root, 'chain=%s' % quote(chain, safe=''))
+
+
+def partition_path(root: str, chain: str, action: str, day: int):
+    return os.path.join(chain_path(root, chain), 'type=%s' % action, 'day=%s' % day_name(day))
+
+
+def uint64_column(values, present=None):
+    array = np.frombuffer(values, dtype=np.uint64)
+    mask = np.frombuffer(present, dtype=np.uint8) == 0 if present is not None else None
+    return pa.array(array, type=pa.uint64(), mask=mask)
+
+
+def timestamp_column(values, present=None):
+    array = np.frombuffer(values, dtype=np.uint64).astype(np.int64)
+    mask = np.frombuffer(present, dtype=np.uint8) == 0 if present is not None else None
+    return pa.array(array, type=pa.int64(), mask=mask).cast(pa.timestamp('s', tz='UTC'))
+
+
+def enum_column(codes: bytearray, values):
+    return pa.DictionaryArray.from_arrays(
+        pa.array(np.frombuffer(codes, dtype=np.int8)), pa.array([value.value for value in values])
+    )
+
+
+def batch_table(batch: EventBatch):
+    """Arrow table of an EventBatch, built from its typed columns without going through events."""
+    has_end = bytearray(end != 0 for end in batch.end)
+    return pa.Table.from_arrays([
+        pa.array(batch.id, pa.string()),
+        uint64_column(batch.round),
+        timestamp_column(batch.created_at),
+        uint64_column(batch.app_id),
+        enum_column(batch.kind, KINDS),
+        enum_column(batch.market, MARKETS),
+        uint64_column(batch.amount, batch.has_amount),
+        uint64_column(batch.currency, batch.has_currency),
+        pa.array(batch.from_address, pa.string()),
+        pa.array(batch.nft_app_id, pa.uint64()),
+        pa.array([str(nft_id) if nft_id is not None else None for nft_id in batch.nft_id], pa.string()),
+        timestamp_column(batch.end, has_end),
+        uint64_column(batch.fee, batch.has_fee),
+    ], schema=SCHEMA)
+
+
+class PartFile:
+    """A Parquet file of one partition being written, hidden from readers until it is rolled."""
+
+    def __init__(self, directory: str, first_round: int, first_id: str):
+        self.directory = directory
+        self.first_round = first_round
+        self.first_id = first_id
+        self.last_round = first_round
+        self.hidden = os.path.join(directory, '.part-%010d-%s.parquet' % (first_round, first_id))
+        self.writer = pq.ParquetWriter(self.hidden, SCHEMA)
+
+    def write(self, batch: EventBatch):
+        """Append a batch as a row group."""
+        self.writer.write_table(batch_table(batch))
+        self.last_round = max(self.last_round, max(batch.round))
+
+    def roll(self):
+        self.writer.close()
+        name = 'part-%010d-%010d-%s.parquet' % (self.first_round, self.last_round, self.first_id)
+        os.replace(self.hidden, os.path.join(self.directory, name))
+
+
+class ParquetSink(Sink):
+    """Writes the events of a chain to Parquet files partitioned by event type and day (UTC).
+
+    The layout is hive style, `root/chain=voi%3Atestnet/type=buy/day=2024-01-31/part-*.parquet`, so
+    readers such as pyarrow.dataset or DuckDB prune partitions and read only the columns they
+    select. Events are buffered in one EventBatch per partition and every flush appends them as a
+    row group to the partition's open file, a hidden `.part-*` file that readers skip. `advance`
+    rolls the files, closing them under their `part-<first round>-<last round>-<first id>` name,
+    once they hold file_size rows or have been open for roll_interval seconds, and then saves the
+    round in the chain's `_cursor` file.
+
+    The SQLite sink commits its cursor without waiting for the files to roll, so after a restart
+    catch_up writes the events it stored after the rolled round again. Hidden files left behind are
+    removed, and the ids of the events already rolled after the cursor are skipped.
+
+    Args:
+        root: Directory of the dataset.
+        chain: Chain of the events, the sink keeps one cursor per chain.
+        flush_size: Number of buffered events that triggers a flush, i.e. the size of row groups.
+        file_size: Number of rows after which files are rolled on the next advance.
+        roll_interval: Seconds after which files are rolled on the next advance even if smaller.
+    """
+
+    def __init__(self, root: str, chain: str, flush_size: int = 100_000, file_size: int = 1_000_000,
+                 roll_interval: float = 600.0):
+        self.root = root
+        self.chain = chain
+        self.flush_size = flush_size
+        self.file_size = file_size
+        self.roll_interval = roll_interval
+        self.partitions = dict()
+        self.size = 0
+        # (type, day) -> PartFile
+        self.files = dict()
+        self.rows = 0
+        self.opened = None
+        self.round, self.written = self.recover()
+        self.advanced = self.round
+
+    def cursor_path(self):
+        return os.path.join(chain_path(self.root, self.chain), CURSOR_FILE)
+
+    def recover(self):
+        """Return the round rolled last and the ids of the events rolled after it, removing unfinished files."""
+        round_num = -1
+        if os.path.exists(self.cursor_path()):
+            with open(self.cursor_path()) as file:
+                round_num = int(file.read())
+        written = set()
+        for directory, _, names in os.walk(chain_path(self.root, self.chain)):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.startswith('.part-'):
+                    os.remove(path)
+                    continue
+                match = PART_FILE.fullmatch(name)
+                if match is not None and int(match.group(2)) > round_num:
+                    written.update(pq.ParquetFile(path).read(columns=['id']).column('id').to_pylist())
+        return round_num, written
+
+    def write(self, event):
+        if event.id in self.written:
+            return
+        key = (event.type.value, event.created_at // SECONDS_PER_DAY)
+        batch = self.partitions.get(key)
+        if batch is None:
+            batch = self.partitions[key] = EventBatch()
+        batch.append(event)
+        self.size += 1
+        if self.size >= self.flush_size:
+            self.flush()
+
+    def advance(self, round_num: int, min_round: int, max_round: int, next_token: str = None):
+        self.advanced = round_num
+        if self.rows + self.size >= self.file_size or (
+                self.opened is not None and monotonic() - self.opened >= self.roll_interval):
+            self.roll(round_num)
+
+    def catch_up(self, events, through_round: int):
+        """Write the events, in round order, after the round rolled last and roll the files.
+
+        Args:
+            events: Events stored by the sink that keeps the cursor, e.g. SqliteSink.stored_events.
+            through_round: Round the cursor of that sink is at; the scan resumes after it, so the
+                events after it are remembered and not written twice.
+        """
+        for event in events:
+            if event.round > self.round:
+                self.write(event)
+                if event.round > through_round:
+                    self.written.add(event.id)
+        self.roll(max(through_round, self.advanced))
+
+    def flush(self):
+        for key, batch in self.partitions.items():
+            part = self.files.get(key)
+            if part is None:
+                path = partition_path(self.root, self.chain, *key)
+                os.makedirs(path, exist_ok=True)
+                part = self.files[key] = PartFile(path, batch.round[0], batch.id[0])
+            part.write(batch)
+            self.rows += len(batch)
+        if self.opened is None and self.files:
+            self.opened = monotonic()
+        self.partitions = dict()
+        self.size = 0
+
+    def roll(self, round_num: int):
+        """Close the open files and save `round_num` as the round every event up to is rolled."""
+        self.flush()
+        for part in self.files.values():
+            part.roll()
+        self.files = dict()
+        self.rows = 0
+        self.opened = None
+        if round_num > self.round:
+            os.makedirs(chain_path(self.root, self.chain), exist_ok=True)
+            with open(self.cursor_path() + '.tmp', 'w') as file:
+                file.write(str(round_num))
+            os.replace(self.cursor_path() + '.tmp', self.cursor_path())
+            self.round = round_num
+
+    def close(self):
+        self.roll(self.advanced)
+
+
+def export_database(path: str, root: str, flush_size: int = 100_000):
+    """Export the events table of an SQLite database written by SqliteSink to a Parquet dataset.
+
+    Only the events after the rounds already exported are written, so exporting again is incremental.
+    """
+    connection = sqlite3.connect(path)
+    try:
+        chains = [chain for chain, in connection.execute('SELECT DISTINCT chain FROM events ORDER BY chain')]
+        for chain in chains:
+            sink = ParquetSink(root, chain, flush_size)
+            rows = connection.execute(
+                'SELECT %s FROM events WHERE chain = ? AND round > ? ORDER BY round, rowid' % ', '.join(EVENT_COLUMNS),
+                (chain, sink.round),
+            )
+            last_round = connection.execute('SELECT MAX(round) FROM events WHERE chain = ?', (chain,)).fetchone()[0]
+            sink.catch_up((row_event(row) for row in rows), last_round)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export indexed events to a partitioned Parquet dataset.')
+    parser.add_argument('--database', default='indexer.sqlite', help='SQLite file written by the pipeline')
+    parser.add_argument('--output', required=True, help='root directory of the Parquet dataset')
+    args = parser.parse_args()
+
+    export_database(args.database, args.output)
@@ -0,0 +1,91 @@
+import os
+
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from all_contrat.fixtures import sample_transaction, sample_context
+from all_contrat.decoders import decode_transaction
+from all_contrat.export import ParquetSink, export_database
+from all_contrat.sinks import SqliteSink, TeeSink
+
+
+def test_parquet_export_is_partitioned_and_typed(tmp_path):
+    context = sample_context()
+    notes = ['sale,buy,1/72', 'sale,buy,200/72', 'sale,cancel,1/72', 'auction,create,1/72']
+    events = [decode_transaction(sample_transaction(note, index), context) for index, note in enumerate(notes)]
+    events.append(events[0]._replace(id='TXDAY2', created_at=events[0].created_at + 86400))
+    sink = ParquetSink(str(tmp_path), 'voi:testnet', flush_size=3)
+    for event in events:
+        sink.write(event)
+    sink.close()
+
+    assert sorted(os.listdir(tmp_path / 'chain=voi%3Atestnet')) == ['type=buy', 'type=cancel', 'type=create']
+    dataset = ds.dataset(str(tmp_path), format='parquet', partitioning='hive')
+    assert set(dataset.to_table(columns=['chain']).column('chain').to_pylist()) == {'voi:testnet'}
+    buys = dataset.to_table(filter=ds.field('type') == 'buy', columns=['id', 'amount', 'currency', 'day']).to_pylist()
+    assert sorted((row['id'], row['amount'], row['currency'], row['day']) for row in buys) == [
+        ('TX0', 1_000_000, 0, '2023-11-14'),
+        ('TX1', 1_000_000, 6779767, '2023-11-14'),
+        ('TXDAY2', 1_000_000, 0, '2023-11-15'),
+    ]
+    cancel = dataset.to_table(filter=ds.field('type') == 'cancel').to_pylist()[0]
+    assert cancel['amount'] is None and cancel['kind'] == 'sale' and cancel['ends_at'] is None
+    create = dataset.to_table(filter=ds.field('type') == 'create').to_pylist()[0]
+    assert create['ends_at'].timestamp() == 1700003600
+
+
+def test_parquet_files_hold_many_pages_and_roll_on_size(tmp_path):
+    context = sample_context()
+    events = [decode_transaction(sample_transaction('sale,buy,1/72', index, round_num=index), context)
+              for index in range(1, 6)]
+    sink = ParquetSink(str(tmp_path), 'voi:testnet', flush_size=1, file_size=2)
+    for event in events:
+        sink.write(event)
+        sink.advance(event.round, 1, 5)
+    sink.close()
+    day = tmp_path / 'chain=voi%3Atestnet' / 'type=buy' / 'day=2023-11-14'
+    assert sorted(os.listdir(day)) == ['part-0000000001-0000000002-TX1.parquet',
+                                       'part-0000000003-0000000004-TX3.parquet',
+                                       'part-0000000005-0000000005-TX5.parquet']
+    assert pq.ParquetFile(str(day / 'part-0000000001-0000000002-TX1.parquet')).num_row_groups == 2
+    assert (tmp_path / 'chain=voi%3Atestnet' / '_cursor').read_text() == '5'
+
+
+def test_parquet_catches_up_with_the_database_after_a_restart(tmp_path):
+    context = sample_context()
+    events = [decode_transaction(sample_transaction('sale,buy,1/72', index, round_num=index), context)
+              for index in range(1, 5)]
+    sqlite = SqliteSink(str(tmp_path / 'indexer.sqlite'), flush_interval=0)
+    sink = TeeSink(sqlite, ParquetSink(str(tmp_path / 'dataset'), 'voi:testnet', flush_size=1))
+    for event in events[:3]:
+        sink.write(event)
+        sink.advance(event.round, 1, 4)
+    # the process stops with the cursor committed and the Parquet file still open
+    assert sqlite.checkpoint.load()[0] == 3
+    assert ds.dataset(str(tmp_path / 'dataset'), format='parquet').files == []
+
+    # an event past the cursor was stored too, the resumed scan skips it as already seen
+    sqlite.write(events[3])
+    sqlite.flush()
+    for restart in range(2):
+        parquet = ParquetSink(str(tmp_path / 'dataset'), 'voi:testnet')
+        parquet.catch_up(sqlite.stored_events('voi:testnet', parquet.round), sqlite.checkpoint.load()[0])
+        parquet.write(events[3])
+        parquet.close()
+    dataset = ds.dataset(str(tmp_path / 'dataset'), format='parquet', partitioning='hive')
+    assert sorted(dataset.to_table(columns=['id']).column('id').to_pylist()) == ['TX1', 'TX2', 'TX3', 'TX4']
+    sqlite.close()
+
+
+def test_export_database_is_incremental(tmp_path):
+    context = sample_context()
+    sqlite = SqliteSink(str(tmp_path / 'indexer.sqlite'), flush_interval=0)
+    for index in range(1, 4):
+        sqlite.write(decode_transaction(sample_transaction('sale,buy,1/72', index, round_num=index), context))
+        if index == 2:
+            sqlite.flush()
+            export_database(str(tmp_path / 'indexer.sqlite'), str(tmp_path / 'dataset'))
+    sqlite.close()
+    export_database(str(tmp_path / 'indexer.sqlite'), str(tmp_path / 'dataset'))
+    dataset = ds.dataset(str(tmp_path / 'dataset'), format='parquet', partitioning='hive')
+    assert sorted(dataset.to_table(columns=['id']).column('id').to_pylist()) == ['TX1', 'TX2', 'TX3']
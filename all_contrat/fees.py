@@ -0,0 +1,97 @@
+from datetime import datetime, timezone
+
+
+SECONDS_PER_DAY = 86400
+SQLITE_MAX_INTEGER = 2 ** 63 - 1
+
+FEES_TABLE = (
+    'CREATE TABLE IF NOT EXISTS fees ('
+    'chain TEXT, day TEXT, currency TEXT, kind TEXT, events INTEGER, fees INTEGER, '
+    'PRIMARY KEY (chain, day, currency, kind))'
+)
+
+
+def day_name(day: int):
+    return datetime.fromtimestamp(day * SECONDS_PER_DAY, timezone.utc).strftime('%Y-%m-%d')
+
+
+class FeeTotals:
+    """Running fee revenue per chain, day (UTC), market currency and contract kind.
+
+    Fees are always paid in VOI; `currency` is the one the event's market trades in (0 for VOI, the
+    ARC200 app id otherwise). `add` only bumps an in-memory delta, so an event costs one dict update.
+    The sink adds only the events its insert actually stored, not the ones it ignored as already
+    present. Like Checkpoint, `save` folds the deltas into the `fees` table without committing, and
+    the sink commits them in the same transaction as the events and the cursor, so a resume or a
+    rewritten event does not count again.
+
+    Currencies are uint64 app ids and stored as text, like in the events table. Fee totals are
+    clamped to the largest SQLite INTEGER, far above the 10^16 microVOI of the whole VOI supply.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.deltas = dict()
+        with self.connection:
+            self.connection.execute(FEES_TABLE)
+            columns = {column[1]: column[2] for column in self.connection.execute('PRAGMA table_info(fees)')}
+            if columns['currency'] == 'INTEGER':
+                # tables written before currencies were stored as text
+                self.connection.execute('ALTER TABLE fees RENAME TO integer_fees')
+                self.connection.execute(FEES_TABLE)
+                self.connection.execute('INSERT INTO fees SELECT chain, day, CAST(currency AS TEXT), kind, events, fees '
+                                        'FROM integer_fees')
+                self.connection.execute('DROP TABLE integer_fees')
+
+    def add(self, event):
+        if event.fee is None:
+            return
+        key = (event.chain, event.created_at // SECONDS_PER_DAY, event.currency or 0, event.kind.value)
+        delta = self.deltas.get(key)
+        if delta is None:
+            self.deltas[key] = [1, event.fee]
+        else:
+            delta[0] += 1
+            delta[1] += event.fee
+
+    def save(self):
+        if self.deltas:
+            self.connection.executemany(
+                'INSERT INTO fees (chain, day, currency, kind, events, fees) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (chain, day, currency, kind) DO UPDATE SET '
+                'events = events + excluded.events, fees = CASE WHEN fees > %d - excluded.fees THEN %d '
+                'ELSE fees + excluded.fees END' % (SQLITE_MAX_INTEGER, SQLITE_MAX_INTEGER),
+                [(chain, day_name(day), str(currency), kind, events, min(fees, SQLITE_MAX_INTEGER))
+                 for (chain, day, currency, kind), (events, fees) in self.deltas.items()]
+            )
+        self.deltas = dict()
+
+    def totals(self, chain: str = None, since: str = None):
+        """Return the committed (chain, day, currency, kind, events, fees) rows, optionally from a day on."""
+        query = 'SELECT chain, day, currency, kind, events, fees FROM fees WHERE 1 = 1'
+        parameters = []
+        if chain is not None:
+            query += ' AND chain = ?'
+            parameters.append(chain)
+        if since is not None:
+            query += ' AND day >= ?'
+            parameters.append(since)
+        # numeric order of the currencies stored as text
+        rows = self.connection.execute(query + ' ORDER BY chain, day, LENGTH(currency), currency, kind', parameters)
+        return [(chain, day, int(currency), kind, events, fees) for chain, day, currency, kind, events, fees in rows]
+
+
+if __name__ == '__main__':
+    import argparse
+    import sqlite3
+
+    parser = argparse.ArgumentParser(description='Print the fee revenue aggregates of an indexer database.')
+    parser.add_argument('--database', default='indexer.sqlite', help='SQLite file written by the pipeline')
+    parser.add_argument('--chain', default=None)
+    parser.add_argument('--since', default=None, help='first day to print, YYYY-MM-DD')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database)
+    for chain, day, currency, kind, events, fees in FeeTotals(connection).totals(args.chain, args.since):
+        print({'chain': chain, 'day': day, 'currency': currency, 'kind': kind, 'events': events, 'fees': fees})
+    connection.close()
@@ -0,0 +1,40 @@
+from all_contrat.fixtures import sample_transaction, sample_context
+from all_contrat.decoders import decode_transaction
+from all_contrat.sinks import SqliteSink
+
+
+def test_fee_totals_are_committed_with_the_cursor(tmp_path):
+    context = sample_context()
+    notes = ['sale,buy,1/72', 'sale,buy,1/72', 'sale,buy,200/72', 'sale,cancel,1/72', 'auction,bid,1/72']
+    events = [decode_transaction(sample_transaction(note, i), context) for i, note in enumerate(notes)]
+    events = [event._replace(fee=fee) for event, fee in zip(events, (28500, 28500, 28500, 0, None))]
+    events.append(events[0]._replace(id='TXDAY2', created_at=events[0].created_at + 86400))
+    sink = SqliteSink(str(tmp_path / 'indexer.sqlite'), flush_interval=0)
+    for event in events[:3]:
+        sink.write(event)
+    assert sink.fees.totals() == []
+    sink.advance(1, 1, 2)
+    for event in events[3:]:
+        sink.write(event)
+    sink.close()
+
+    sink = SqliteSink(str(tmp_path / 'indexer.sqlite'), flush_interval=0)
+    # rewritten events, e.g. a rerun over the same rounds, are ignored and not counted again
+    for event in events + events[:2]:
+        sink.write(event)
+    sink.flush()
+    assert sink.fees.totals() == [
+        ('voi:testnet', '2023-11-14', 0, 'sale', 3, 57000),
+        ('voi:testnet', '2023-11-14', 6779767, 'sale', 1, 28500),
+        ('voi:testnet', '2023-11-15', 0, 'sale', 1, 28500),
+    ]
+    assert sink.fees.totals(since='2023-11-15') == [('voi:testnet', '2023-11-15', 0, 'sale', 1, 28500)]
+    sink.close()
+
+
+def test_decoded_events_carry_the_fee_payment():
+    transaction = sample_transaction('sale,buy,200/72')
+    transaction['inner-txns'][-1]['payment-transaction']['amount'] = 28500
+    event = decode_transaction(transaction, sample_context())
+    assert event.fee == 28500
+    assert event.amount == 1_000_000
@@ -0,0 +1,83 @@
+import json
+from base64 import b64decode
+from hashlib import sha256
+
+from all_contrat.events import Kind, Market
+
+
+def fingerprint(program: bytes):
+    return sha256(program).hexdigest()
+
+
+class ProgramClassifier:
+    """Tells which marketplace contract an app runs from the hash of its approval program.
+
+    `fingerprints` maps the sha256 of each known compiled approval program to its (Kind, Market).
+    An app's program is fetched and hashed once, after that `classify` is a dict lookup. Apps
+    running an unknown program classify as None, which is cached as well.
+    """
+
+    def __init__(self, fetch_program, fingerprints=None):
+        # fetch_program(app_id) -> approval program bytes
+        self.fetch_program = fetch_program
+        self.fingerprints = dict(fingerprints or {})
+        self.apps = dict()
+
+    def __len__(self):
+        return len(self.apps)
+
+    def add(self, program: bytes, kind: Kind, market: Market):
+        """Register a compiled variant of a marketplace contract."""
+        self.fingerprints[fingerprint(program)] = (Kind(kind), Market(market))
+
+    def observe(self, transaction):
+        """Classify apps from their creation transaction, which carries the program, without a lookup."""
+        app_id = transaction.get('created-application-index')
+        program = transaction.get('application-transaction', {}).get('approval-program')
+        if app_id and program:
+            self.apps[app_id] = self.fingerprints.get(fingerprint(b64decode(program)))
+        for inner_txn in transaction.get('inner-txns', []):
+            self.observe(inner_txn)
+
+    def classify(self, app_id: int):
+        """Return the (Kind, Market) of the contract an app runs, or None for unknown programs."""
+        if app_id not in self.apps:
+            self.apps[app_id] = self.fingerprints.get(fingerprint(self.fetch_program(app_id)))
+        return self.apps[app_id]
+
+    def load(self, path: str):
+        """Add the fingerprints of a JSON file written by `save`."""
+        with open(path) as file:
+            for digest, variant in json.load(file).items():
+                kind, market = variant.split(',')
+                self.fingerprints[digest] = (Kind(kind), Market(market))
+
+    def save(self, path: str):
+        with open(path, 'w') as file:
+            json.dump({digest: '%s,%s' % (kind.value, market.value)
+                       for digest, (kind, market) in sorted(self.fingerprints.items())}, file, indent=2)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from all_contrat import indexer
+    from all_contrat.networks import PROFILES
+
+    parser = argparse.ArgumentParser(description='Record the approval program fingerprints of reference marketplace apps.')
+    parser.add_argument('--chain', choices=sorted(PROFILES), default=indexer.DEFAULT_CHAIN)
+    parser.add_argument('--app', action='append', required=True, metavar='KIND,MARKET=APP_ID',
+                        help='an app known to run a contract variant, e.g. sale,1/72=6448440')
+    parser.add_argument('--output', default='fingerprints.json', help='JSON file to add the fingerprints to')
+    args = parser.parse_args()
+
+    network = indexer.get_network(args.chain)
+    try:
+        network.classifier.load(args.output)
+    except FileNotFoundError:
+        pass
+    for app in args.app:
+        variant, app_id = app.split('=')
+        kind, market = variant.split(',')
+        network.classifier.add(network.approval_program(int(app_id)), kind, market)
+    network.classifier.save(args.output)
@@ -0,0 +1,36 @@
+from all_contrat.fixtures import sample_transaction, sample_context
+from all_contrat.decoders import decode_transaction
+from all_contrat.events import Kind, Market
+from all_contrat.fingerprints import ProgramClassifier
+
+
+SALE_PROGRAM = b'\x0a\x20sale voi arc72'
+
+
+def test_classify_fetches_each_app_once(tmp_path):
+    fetched = []
+
+    def fetch_program(app_id):
+        fetched.append(app_id)
+        return SALE_PROGRAM if app_id == 1000 else b'\x0a\x20something else'
+
+    classifier = ProgramClassifier(fetch_program)
+    classifier.add(SALE_PROGRAM, 'sale', '1/72')
+    path = str(tmp_path / 'fingerprints.json')
+    classifier.save(path)
+    classifier = ProgramClassifier(fetch_program)
+    classifier.load(path)
+    for app_id in (1000, 1001, 1000, 1001):
+        classifier.classify(app_id)
+    assert fetched == [1000, 1001]
+    assert classifier.classify(1000) == (Kind.SALE, Market.VOI_ARC72)
+    assert classifier.classify(1001) is None
+
+
+def test_decode_skips_apps_not_running_the_noted_contract():
+    classifier = ProgramClassifier(lambda app_id: SALE_PROGRAM)
+    classifier.add(SALE_PROGRAM, 'sale', '1/72')
+    context = sample_context()
+    context.classify = classifier.classify
+    assert decode_transaction(sample_transaction('sale,buy,1/72'), context).type == 'buy'
+    assert decode_transaction(sample_transaction('dutch,buy,1/72'), context) is None
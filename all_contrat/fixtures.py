@@ -0,0 +1,81 @@
+from base64 import b64encode
+
+from all_contrat.constants import FEES_ADDRESS
+from all_contrat.decoders import DECODERS, DecodeContext
+
+
+SELLER = 'SELLERAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+ARC200_APP_ID = 6779767
+
+
+def b64_int(value: int, length: int = 8):
+    return b64encode(value.to_bytes(length, 'big')).decode()
+
+
+def payment(receiver: str, amount: int, note: str = None):
+    tx = {
+        'tx-type': 'pay',
+        'payment-transaction': {'receiver': receiver, 'amount': amount}
+    }
+    if note is not None:
+        tx['note'] = b64encode(note.encode()).decode()
+    return tx
+
+
+def arc200_transfer(amount: int):
+    return {
+        'tx-type': 'appl',
+        'application-transaction': {
+            'application-id': ARC200_APP_ID,
+            'application-args': [b64encode(bytes.fromhex('da7025b9')).decode(),
+                                 b64encode(bytes(32)).decode(),
+                                 b64_int(amount, 32)]
+        }
+    }
+
+
+def arc72_transfer(token_id: int):
+    return {
+        'tx-type': 'appl',
+        'application-transaction': {
+            'application-id': 29088600,
+            'application-args': [b64encode(bytes.fromhex('f2f194a0')).decode(),
+                                 b64encode(bytes(32)).decode(),
+                                 b64encode(bytes(31) + b'\x01').decode(),
+                                 b64_int(token_id, 32)]
+        }
+    }
+
+
+def sample_transaction(note: str, index: int = 0, price: int = 1_000_000, round_num: int = 6448448):
+    """Build a fee address transaction in the shape returned by the indexer."""
+    if '200/' in note:
+        inner_txns = [payment(SELLER, 28500), arc200_transfer(price), arc200_transfer(price)]
+    else:
+        inner_txns = [payment(SELLER, price), payment(SELLER, price)]
+    inner_txns.append(arc72_transfer(7))
+    inner_txns.append(payment(FEES_ADDRESS, 0, note))
+    return {
+        'id': 'TX%d' % index,
+        'sender': SELLER,
+        'round-time': 1700000000 + index,
+        'confirmed-round': round_num,
+        'tx-type': 'appl',
+        'application-transaction': {
+            'application-id': 1000 + index,
+            'application-args': [b64encode(b'update_price').decode(), b64_int(price)]
+        },
+        'inner-txns': inner_txns
+    }
+
+
+def sample_transactions(count: int):
+    notes = [','.join(key) for key in DECODERS]
+    return [sample_transaction(notes[i % len(notes)], i) for i in range(count)]
+
+
+def sample_context(chain: str = 'voi:testnet'):
+    state = {b'price': 1_000_000, b'arc200_app_id': ARC200_APP_ID, b'nft_app_id': 29088600, b'nft_id': bytes(31) + b'\x07',
+             b'bid_amount': 1_000_000, b'bid_account': bytes(32), b'start': 1699996400, b'end': 1700003600,
+             b'max_price': 2_000_000, b'min_price': 1_000_000}
+    return DecodeContext(chain, FEES_ADDRESS, lambda app_id, round_num: state)
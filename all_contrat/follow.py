@@ -0,0 +1,120 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from all_contrat import indexer, metrics
+from all_contrat.blocks import block_transactions
+from all_contrat.decoders import decode_transaction
+from all_contrat.dedupe import Deduplicator
+from all_contrat.networks import PROFILES
+from all_contrat.pipeline import with_views
+from all_contrat.sinks import Sink, PrintSink, SqliteSink
+
+
+def cursor_name(chain: str):
+    """Checkpoint name of follow runs, apart from the cursors of range scans on the same database."""
+    return '%s/follow' % chain
+
+
+def fetch_round(network: indexer.Network, round_num: int, address: str):
+    """Wait until `round_num` is committed, then return its fee address transactions.
+
+    `status_after_block` long-polls algod and returns as soon as a later round exists, or after
+    the node's own timeout, in which case the wait starts over.
+    """
+    while True:
+        tip = network.client.status_after_block(round_num - 1)['last-round']
+        metrics.CHAIN_TIP.set(tip, chain=network.chain)
+        if tip >= round_num:
+            break
+    return block_transactions(network.client, round_num, address, network)
+
+
+def decode_round(network: indexer.Network, transactions):
+    events = []
+    for transaction in transactions:
+        event = decode_transaction(transaction, network.context)
+        if event is not None:
+            events.append(event)
+    return events
+
+
+async def follow(network: indexer.Network = None, sink: Sink = None, start_round: int = None, address: str = None,
+                 stop_round: int = None, dedupe: Deduplicator = None):
+    """Follow the chain tip, handing the events of every new round to the sink as soon as it is final.
+
+    Blocks are read from algod rather than the indexer, which lags behind the tip. While round N is
+    decoded, the fetch of round N+1 is already waiting on algod, so a round's events reach the sink
+    right after the block is committed. The sink is flushed and its cursor advanced after every round.
+
+    Args:
+        network: The chain to follow, defaults to voi:testnet.
+        sink: Receives the events, defaults to printing them. A run resumes after the sink's cursor,
+            give it a cursor of its own (see cursor_name) so other runs do not move it.
+        start_round: First round to follow. Defaults to the round after the sink's cursor, or after
+            the current tip when there is no cursor yet.
+        address: The fees address whose transactions are indexed, defaults to the network's.
+        stop_round: Last round to follow, follows forever when None.
+        dedupe: Drops the transactions whose events were already written, see dedupe.Deduplicator.
+    """
+    if network is None:
+        network = indexer.get_network()
+    if sink is None:
+        sink = PrintSink()
+    if address is None:
+        address = network.fees_address
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        if start_round is None:
+            # without a cursor resume hands back the min_round it was given, round 0 is never followed
+            start_round, _ = sink.resume(0, 0)
+        if start_round == 0:
+            start_round = (await loop.run_in_executor(executor, network.client.status))['last-round'] + 1
+        round_num, _ = sink.resume(start_round, start_round)
+        prefetch = loop.run_in_executor(executor, fetch_round, network, round_num, address)
+        while stop_round is None or round_num <= stop_round:
+            transactions = await prefetch
+            if dedupe is not None:
+                transactions = [transaction for transaction in transactions if dedupe.admit(transaction['id'])]
+            if stop_round is None or round_num < stop_round:
+                prefetch = loop.run_in_executor(executor, fetch_round, network, round_num + 1, address)
+            for event in await loop.run_in_executor(executor, decode_round, network, transactions):
+                metrics.count_event(event)
+                await sink.publish(event)
+            sink.advance(round_num, start_round, round_num)
+            sink.flush()
+            metrics.count_round(network.chain, round_num, round_num - 1)
+            metrics.LAG.set(max(metrics.CHAIN_TIP.values.get((network.chain,), round_num) - round_num, 0),
+                            chain=network.chain)
+            round_num += 1
+    finally:
+        # a pending long poll returns on its own, there is no need to wait for it
+        executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Follow the chain tip and index marketplace events as rounds commit.')
+    parser.add_argument('--chain', choices=sorted(PROFILES), default=indexer.DEFAULT_CHAIN)
+    parser.add_argument('--start-round', type=int, default=None, help='defaults to the round after the cursor, or the current tip')
+    parser.add_argument('--metrics-port', type=int, help='serve Prometheus metrics on this port at /metrics')
+    parser.add_argument('--views', action='store_true', help='keep in-memory views of the open listings and '
+                                                             'auctions, their size is exported as metrics')
+    parser.add_argument('--database', default=None, help='SQLite file holding the events and the cursor, '
+                                                         'events are printed when omitted')
+    args = parser.parse_args()
+
+    network = indexer.get_network(args.chain)
+    if args.metrics_port:
+        metrics.instrument(network)
+        metrics.serve(args.metrics_port)
+    sink = SqliteSink(args.database, cursor_name(network.chain), flush_interval=0) if args.database else PrintSink()
+    if args.views:
+        sink = with_views(sink, network)
+    try:
+        asyncio.run(follow(network, sink, args.start_round, dedupe=Deduplicator(sink)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
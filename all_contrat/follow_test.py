@@ -0,0 +1,60 @@
+import asyncio
+
+from all_contrat import follow
+from all_contrat.fixtures import sample_transaction, sample_context
+from all_contrat.indexer import Network
+from all_contrat.networks import PROFILES
+from all_contrat.sinks import SqliteSink
+
+
+def test_follow_writes_rounds_in_order_and_resumes(monkeypatch, tmp_path):
+    tip = {'round': 10}
+    fetched = []
+
+    def status_after_block(round_num):
+        # every long poll commits one more round
+        tip['round'] = max(tip['round'], round_num + 1)
+        return {'last-round': tip['round']}
+
+    def block_transactions(client, round_num, address, state_cache):
+        fetched.append(round_num)
+        return [sample_transaction('sale,buy,1/72', round_num, round_num=round_num)]
+
+    network = Network(PROFILES['voi:testnet'])
+    network.context = sample_context()
+    monkeypatch.setattr(network.client, 'status_after_block', status_after_block)
+    monkeypatch.setattr(follow, 'block_transactions', block_transactions)
+    sink = SqliteSink(str(tmp_path / 'indexer.sqlite'), flush_interval=0)
+
+    asyncio.run(follow.follow(network, sink, start_round=11, stop_round=13))
+    asyncio.run(follow.follow(network, sink, start_round=11, stop_round=15))
+    assert fetched == [11, 12, 13, 14, 15]
+    assert sink.checkpoint.load()[0] == 15
+    rounds = sink.connection.execute('SELECT round FROM events ORDER BY round').fetchall()
+    assert [round_num for round_num, in rounds] == [11, 12, 13, 14, 15]
+    sink.close()
+
+
+def test_follow_restart_resumes_after_the_cursor_not_the_tip(monkeypatch, tmp_path):
+    tip = {'round': 10}
+    fetched = []
+
+    def status_after_block(round_num):
+        tip['round'] = max(tip['round'], round_num + 1)
+        return {'last-round': tip['round']}
+
+    def block_transactions(client, round_num, address, state_cache):
+        fetched.append(round_num)
+        return []
+
+    network = Network(PROFILES['voi:testnet'])
+    monkeypatch.setattr(network.client, 'status', lambda: {'last-round': tip['round']})
+    monkeypatch.setattr(network.client, 'status_after_block', status_after_block)
+    monkeypatch.setattr(follow, 'block_transactions', block_transactions)
+    sink = SqliteSink(str(tmp_path / 'indexer.sqlite'), follow.cursor_name(network.chain), flush_interval=0)
+
+    asyncio.run(follow.follow(network, sink, stop_round=13))
+    tip['round'] = 50
+    asyncio.run(follow.follow(network, sink, stop_round=15))
+    assert fetched == [11, 12, 13, 14, 15]
+    sink.close()
@@ -2,326 +2,165 @@ from algosdk.v2client.algod import AlgodClient
 from algosdk.v2client.indexer import IndexerClient
 from base64 import b64decode
 
+from all_contrat.blocks import block_transactions
+from all_contrat.decoders import DecodeContext, decode_transaction
+from all_contrat.fingerprints import ProgramClassifier
+from all_contrat.networks import PROFILES, NetworkProfile
+from all_contrat.scheduler import schedule
+from all_contrat.state_cache import GlobalStateCache
 
-FEES_ADDRESS = '3FXLFER4JF4SPVBSSTPZWGTFUYSD54QOEZ4Y4TV4ZTRHERT2Z6DH7Q54YQ'
-algod_token_tx = ""
-headers_tx = {"X-Algo-API-Token": algod_token_tx}
-client = AlgodClient(
-    algod_token=algod_token_tx,
-    algod_address="https://testnet-api.voi.nodly.io:443",
-    headers=headers_tx,
-)
 
+DEFAULT_CHAIN = 'voi:testnet'
 
-def get_app_global_state(app_id: int):
-    app_nfo = client.application_info(app_id)
-    state = dict()
-    for pair in app_nfo["params"]["global-state"]:
-        key = b64decode(pair["key"])
+# Reference rounds on voi:testnet, one per kind of marketplace event:
+# 6448448 create 1/72, 6447176 buy 1/72, 6447461 update 1/72, 6447883 cancel 1/72,
+# 6448094 update 200/72, 6448146 cancel 200/72, 6448206 buy 200/72,
+# 6448343 update voi / rwa, 6448381 close voi / rwa, 6448417 buy voi rwa,
+# 6448480 update arc200 rwa, 6448533 close arc200 rwa, 6448566 buy arc200 rwa,
+# 6448671 close dutch voi 72, 6448811 buy dutch voi 72,
+# 6448957 close dutch arc200 72, 6449122 dutch buy arc200 72
+PAGE_LIMIT = 1000
+# rounds read per fetch_page call, about eight hours of voi blocks
+ROUND_WINDOW = 10_000
 
-        value = pair["value"]
-        value_type = value["type"]
 
-        if value_type == 2:
-            # value is uint64
-            value = value.get("uint", 0)
-        elif value_type == 1:
-            # value is byte array
-            value = b64decode(value.get("bytes", ""))
-        else:
-            raise Exception(f"Unexpected state type: {value_type}")
-        state[key] = value
-    return state
+class Network:
+    """Clients, state cache and decode context of one chain.
 
+    Several networks can be indexed from the same process, each with its own cache and cursor.
+    """
 
-indexer_client = IndexerClient(
-    indexer_token="",
-    indexer_address="https://testnet-idx.voi.nodly.io",
-    headers={"X-Algo-API-Token": ""}
-)
-chain = 'voi:testnet'
+    def __init__(self, profile: NetworkProfile):
+        self.profile = profile
+        self.chain = profile.chain
+        self.fees_address = profile.fees_address
+        headers = {"X-Algo-API-Token": profile.token}
+        self.client = AlgodClient(
+            algod_token=profile.token,
+            algod_address=profile.algod_address,
+            headers=headers,
+        )
+        self.indexer_client = IndexerClient(
+            indexer_token=profile.token,
+            indexer_address=profile.indexer_address,
+            headers=headers,
+        )
+        # requests to one endpoint share a rate limit aware scheduler, whichever network issues them
+        schedule(self.client)
+        schedule(self.indexer_client)
+        self.state_cache = GlobalStateCache(self.app_history)
+        self.classifier = ProgramClassifier(self.approval_program)
+        self.context = DecodeContext(self.chain, self.fees_address, self.state_cache.get)
 
+    def verify_programs(self, path: str):
+        """Only decode apps whose approval program matches a fingerprint of the file at `path`."""
+        self.classifier.load(path)
+        self.context.classify = self.classifier.classify
 
-round = 6446566
-round = 6448448 # create 1/72
-round = 6447176 # buy 1/72
-round = 6447461 # update 1/72
-round = 6447883 # cancel 1/72
-round = 6448094 # update 200/72
-round = 6448146 # cancel 200/72
-round = 6448206 # buy 200/72
-round = 6448343 # update voi / rwa
-round = 6448381 # close voi / rwa
-round = 6448417 # buy voi rwa
-round = 6448480 # update arc200 rwa
-round = 6448533 # close arc200 rwa
-round = 6448566 # buy arc200 rwa
-round = 6448671 # close dutch voi 72
-round = 6448811 # buy dutch voi 72
-round = 6448957 # close dutch arc200 72
-round = 6449122 # dutch buy arc200 72
+    def observe(self, transaction):
+        """Feed a scanned transaction to the state cache and the program classifier."""
+        self.state_cache.observe(transaction)
+        self.classifier.observe(transaction)
 
-round = 6448448
-print(indexer_client.search_transactions_by_address(FEES_ADDRESS, round_num=round)['transactions'])
-print("ok")
-print(indexer_client.search_transactions_by_address(FEES_ADDRESS, round_num=round)['transactions'][0])
+    def approval_program(self, app_id: int):
+        """Approval program of an app, from the indexer so that deleted apps are found too."""
+        response = self.indexer_client.applications(app_id, include_all=True)
+        return b64decode(response['application']['params']['approval-program'])
 
-for transaction in indexer_client.search_transactions_by_address(FEES_ADDRESS, round_num=round)['transactions']:
-    if 'application-transaction' in transaction and 'inner-txns' in transaction:
-        application_id = transaction['application-transaction']['application-id']
-        sender = transaction['sender']
-        round_time = transaction['round-time']
-        tx_id = transaction['id']
-        app_args = transaction['application-transaction']['application-args']
-        inner_txns = [tx for tx in transaction['inner-txns']
-                      if 'note' in tx and 'tx-type' in tx and tx['payment-transaction']['receiver'] == FEES_ADDRESS]
-        if len(inner_txns) == 1:
-            note = b64decode(inner_txns[0]['note']).decode('ascii')
-            type_tx = note.split(",")[0]
-            action_tx = note.split(",")[1]
-            currency_tx = note.split(",")[2]
-            if type_tx == 'sale':
-                if currency_tx == '1/72':
-                    if action_tx == 'fund':
-                        price = get_app_global_state(application_id)[b'price']
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'create',
-                            'amount': price,
-                            'currency': 0,
-                            'note': note
-                        }
-                        print(new_data)
-                    if action_tx == 'update':
-                        price = int.from_bytes(b64decode(app_args[1]), byteorder='big')
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'update',
-                            'amount': price,
-                            'currency': 0,
-                            'note': note
-                        }
-                        print(new_data)
-                    if action_tx == 'buy':
-                        price = transaction['inner-txns'][1]['payment-transaction']['amount']
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'buy',
-                            'amount': price,
-                            'currency': 0,
-                            'note': note
-                        }
-                        print(new_data)
-                    if action_tx == 'close':
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'cancel',
-                            'amount': None,
-                            'currency': None,
-                            'note': note
-                        }
-                        print(new_data)
-                if currency_tx == '200/72':
-                    if action_tx == 'update':
-                        price = int.from_bytes(b64decode(app_args[1]), byteorder='big')
-                        currency = get_app_global_state(application_id)[b"arc200_app_id"]
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'update',
-                            'amount': price,
-                            'currency': currency,
-                            'note': note
-                        }
-                        print(new_data)
-                    elif action_tx == 'buy':
-                        currency = transaction['inner-txns'][2]['application-transaction']['application-id']
-                        price = int.from_bytes(b64decode(transaction['inner-txns'][2]['application-transaction']['application-args'][2]), byteorder='big')
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'buy',
-                            'amount': price,
-                            'currency': currency,
-                            'note': note
-                        }
-                        print(new_data)
-                    elif action_tx == 'close':
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'cancel',
-                            'amount': None,
-                            'currency': None,
-                            'note': note
-                        }
-                        print(new_data)
-                if currency_tx == '1/rwa':
-                    if action_tx == 'update':
-                        price = int.from_bytes(b64decode(app_args[1]), byteorder='big')
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'update',
-                            'amount': price,
-                            'currency': 0,
-                            'note': note
-                        }
-                        print(new_data)
-                    elif action_tx == 'buy':
-                        price = transaction['inner-txns'][0]['payment-transaction']['amount']
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'buy',
-                            'amount': price,
-                            'currency': 0,
-                            'note': note
-                        }
-                        print(new_data)
-                    elif action_tx == 'close':
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'cancel',
-                            'amount': None,
-                            'currency': None,
-                            'note': note
-                        }
-                        print(new_data)
-                if currency_tx == '200/rwa':
-                    if action_tx == 'update':
-                        currency = get_app_global_state(application_id)[b"arc200_app_id"]
-                        price = int.from_bytes(b64decode(app_args[1]), byteorder='big')
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'update',
-                            'amount': price,
-                            'currency': currency,
-                            'note': note
-                        }
-                        print(new_data)
-                    elif action_tx == 'close':
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'cancel',
-                            'amount': None,
-                            'currency': None,
-                            'note': note
-                        }
-                        print(new_data)
-                    elif action_tx == 'buy':
-                        price = int.from_bytes(b64decode(transaction['inner-txns'][1]['application-transaction']['application-args'][2]), byteorder='big')
-                        currency = transaction['inner-txns'][1]['application-transaction']['application-id']
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': type_tx,
-                            'amount': price,
-                            'currency': currency,
-                            'note': note
-                        }
-                        print(new_data)
-            if type_tx == 'dutch':
-                if currency_tx == '1/72':
-                    if action_tx == 'buy':
-                        price = transaction['inner-txns'][0]['payment-transaction']['amount']
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'buy',
-                            'amount': price,
-                            'currency': 0,
-                            'note': note
-                        }
-                        print(new_data)
-                    elif action_tx == 'close':
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'cancel',
-                            'amount': None,
-                            'currency': None,
-                            'note': note
-                        }
-                        print(new_data)
-                if currency_tx == '200/72':
-                    if action_tx == 'buy':
-                        price = int.from_bytes(b64decode(app_args[1]), byteorder='big')
-                        currency = transaction['inner-txns'][1]['application-transaction']['application-id']
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'buy',
-                            'amount': '??',
-                            'currency': currency,
-                            'note': note
-                        }
-                        print(new_data)
-                    if action_tx == 'close':
-                        new_data = {
-                            'id': tx_id,
-                            'created_at': round_time,
-                            'from_address': sender,
-                            'chain': chain,
-                            'app_id': application_id,
-                            'type': 'cancel',
-                            'amount': None,
-                            'currency': None,
-                            'note': note
-                        }
-                        print(new_data)
+    def fetch_page(self, address: str, min_round: int, max_round: int, next_page: str = None):
+        """Fetch the transactions involving `address` in one window of rounds, oldest first.
+
+        The indexer returns the transactions of an address newest first, so the rounds are walked
+        in ascending windows of ROUND_WINDOW rounds and each window is read through all its indexer
+        pages, then reversed. The returned token is the first round of the next window, so every
+        round before it is complete once a page is handed over, like with fetch_block_page.
+        """
+        # cursors saved before windows held indexer tokens, such a scan restarts at its min_round
+        start = int(next_page) if next_page and next_page.isdigit() else min_round
+        end = min(start + ROUND_WINDOW - 1, max_round)
+        transactions = []
+        token = None
+        while True:
+            response = self.indexer_client.search_transactions_by_address(
+                address,
+                limit=PAGE_LIMIT,
+                next_page=token,
+                min_round=start,
+                max_round=end,
+            )
+            page = response.get('transactions', [])
+            transactions.extend(page)
+            token = response.get('next-token')
+            # the indexer may hand out a token for an empty last page
+            if not token or len(page) == 0:
+                break
+        transactions.reverse()
+        return transactions, (str(end + 1) if end < max_round else None)
+
+    def fetch_block_page(self, address: str, min_round: int, max_round: int, next_page: str = None):
+        """Drop-in for fetch_page reading one block from algod per page; the token is the next round."""
+        round_num = int(next_page) if next_page else min_round
+        transactions = block_transactions(self.client, round_num, address, self)
+        return transactions, (str(round_num + 1) if round_num < max_round else None)
+
+    def app_history(self, app_id: int, max_round: int):
+        """Yield the transactions of an application up to `max_round`, starting with its creation."""
+        next_page = None
+        while True:
+            response = self.indexer_client.search_transactions(
+                application_id=app_id,
+                limit=PAGE_LIMIT,
+                next_page=next_page,
+                max_round=max_round,
+            )
+            transactions = response.get('transactions', [])
+            for transaction in transactions:
+                yield transaction
+            next_page = response.get('next-token')
+            if not next_page or len(transactions) == 0:
+                return
+
+    def scan_transactions(self, min_round: int, max_round: int, address: str = None, next_page: str = None):
+        """Yield every transaction involving `address` between `min_round` and `max_round` (inclusive).
+
+        Transactions come in round order, one window of rounds at a time, see fetch_page.
+        """
+        address = address or self.fees_address
+        while True:
+            transactions, next_page = self.fetch_page(address, min_round, max_round, next_page)
+            for transaction in transactions:
+                yield transaction
+            if not next_page:
+                return
+
+    def scan_events(self, min_round: int, max_round: int, address: str = None):
+        """Stream decoded marketplace events for a round range as the pages come in."""
+        for transaction in self.scan_transactions(min_round, max_round, address):
+            self.observe(transaction)
+            event = decode_transaction(transaction, self.context)
+            if event is not None:
+                yield event
+
+
+NETWORKS = dict()
+
+
+def get_network(chain: str = DEFAULT_CHAIN):
+    """Return the Network of a chain profile, created once per process."""
+    if chain not in NETWORKS:
+        NETWORKS[chain] = Network(PROFILES[chain])
+    return NETWORKS[chain]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Dump marketplace events sent to the fees address.')
+    parser.add_argument('--chain', choices=sorted(PROFILES), default=DEFAULT_CHAIN)
+    parser.add_argument('--min-round', type=int, required=True)
+    parser.add_argument('--max-round', type=int, default=None)
+    args = parser.parse_args()
+
+    network = get_network(args.chain)
+    for event in network.scan_events(args.min_round, args.max_round if args.max_round is not None else args.min_round):
+        print(event.as_dict())
@@ -0,0 +1,80 @@
+from typing import NamedTuple, Optional
+
+from all_contrat.decoders import dutch_price
+from all_contrat.events import Action, Kind, Market, MarketEvent
+from all_contrat.sinks import Sink
+
+
+class Listing(NamedTuple):
+    app_id: int
+    nft_app_id: Optional[int]
+    nft_id: Optional[int]
+    price: Optional[int]
+    currency: int
+    seller: str
+    kind: Kind
+    market: Market
+
+
+class ActiveListings(Sink):
+    """In-memory view of the open sale and dutch listings, maintained from the event stream.
+
+    A listing opens on `create`, changes price on `update` and closes on `buy`, `close` or `cancel`.
+    Listings are indexed by app id and by collection (`nft_app_id`), so both lookups are a
+    dict access. Events for apps whose creation was not seen are ignored, and so are english
+    auctions, see auctions.AuctionBook.
+
+    Args:
+        dutch_auctions: app_id -> DutchParams of the dutch auctions, usually the decode context's.
+            Dutch listings are priced at the time asked for when their parameters are known,
+            at their starting price otherwise.
+    """
+
+    def __init__(self, dutch_auctions=None):
+        self.dutch_auctions = dutch_auctions if dutch_auctions is not None else dict()
+        self.listings = dict()
+        self.collections = dict()
+
+    def __len__(self):
+        return len(self.listings)
+
+    def _priced(self, listing: Listing, timestamp: Optional[int]):
+        if listing.kind != Kind.DUTCH or timestamp is None:
+            return listing
+        params = self.dutch_auctions.get(listing.app_id)
+        if params is None:
+            return listing
+        return listing._replace(price=dutch_price(params, timestamp))
+
+    def get(self, app_id: int, timestamp: int = None):
+        listing = self.listings.get(app_id)
+        return self._priced(listing, timestamp) if listing is not None else None
+
+    def for_sale(self, nft_app_id: int, timestamp: int = None):
+        """Return the open listings of a collection, dutch ones priced at `timestamp` when given."""
+        return [self._priced(listing, timestamp) for listing in self.collections.get(nft_app_id, {}).values()]
+
+    def _add(self, listing: Listing):
+        self.listings[listing.app_id] = listing
+        self.collections.setdefault(listing.nft_app_id, dict())[listing.app_id] = listing
+
+    def _remove(self, app_id: int):
+        listing = self.listings.pop(app_id, None)
+        if listing is not None:
+            collection = self.collections[listing.nft_app_id]
+            del collection[app_id]
+            if len(collection) == 0:
+                del self.collections[listing.nft_app_id]
+
+    def write(self, event: MarketEvent):
+        if event.kind == Kind.AUCTION:
+            return
+        if event.type == Action.CREATE:
+            self._add(Listing(event.app_id, event.nft_app_id, event.nft_id, event.amount, event.currency or 0,
+                              event.from_address, event.kind, event.market))
+        elif event.type == Action.UPDATE:
+            listing = self.listings.get(event.app_id)
+            if listing is not None:
+                self._add(listing._replace(price=event.amount))
+        elif event.type in (Action.BUY, Action.CLOSE, Action.CANCEL):
+            self._remove(event.app_id)
@@ -0,0 +1,41 @@
+from all_contrat.decoders import DutchParams
+from all_contrat.events import Action, Kind, Market, new_market_event
+from all_contrat.listings import ActiveListings
+
+
+def event(app_id: int, action: Action, amount=None, nft_app_id=None, kind: Kind = Kind.SALE):
+    return new_market_event('TX', 1, 1, 'SELLER', 'voi:testnet', app_id, kind, action, Market.VOI_ARC72,
+                            amount, 0, nft_app_id, 7 if nft_app_id else None)
+
+
+def test_listing_lifecycle():
+    listings = ActiveListings()
+    listings.write(event(1, Action.CREATE, 100, nft_app_id=50))
+    listings.write(event(2, Action.CREATE, 200, nft_app_id=50))
+    listings.write(event(1, Action.UPDATE, 150))
+    assert sorted(listing.price for listing in listings.for_sale(50)) == [150, 200]
+
+    listings.write(event(1, Action.BUY, 150))
+    listings.write(event(2, Action.CANCEL))
+    assert listings.for_sale(50) == []
+    assert len(listings) == 0
+
+
+def test_update_of_unknown_listing_is_ignored():
+    listings = ActiveListings()
+    listings.write(event(1, Action.UPDATE, 150))
+    assert listings.get(1) is None
+
+
+def test_auctions_are_not_listings():
+    listings = ActiveListings()
+    listings.write(event(1, Action.CREATE, 100, nft_app_id=50, kind=Kind.AUCTION))
+    assert len(listings) == 0
+
+
+def test_dutch_listings_are_priced_at_the_time_asked_for():
+    listings = ActiveListings({1: DutchParams(2000, 1000, 100, 200)})
+    listings.write(event(1, Action.CREATE, 2000, nft_app_id=50, kind=Kind.DUTCH))
+    assert listings.get(1).price == 2000
+    assert listings.get(1, 150).price == 1500
+    assert [listing.price for listing in listings.for_sale(50, 175)] == [1250]
@@ -0,0 +1,199 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter
+
+
+class Registry:
+    """The metrics served together, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.help))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type))
+            for suffix, labels, value in metric.samples():
+                if labels:
+                    label_text = ','.join('%s="%s"' % (name, str(label).replace('"', '\\"'))
+                                          for name, label in labels)
+                    lines.append('%s%s{%s} %s' % (metric.name, suffix, label_text, format_value(value)))
+                else:
+                    lines.append('%s%s %s' % (metric.name, suffix, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric with one value per combination of label values."""
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labels=(), registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = dict()
+        self.lock = Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def _labels(self, key):
+        return list(zip(self.labels, key))
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items(), key=lambda item: tuple(str(label) for label in item[0]))
+        for key, value in values:
+            yield '', self._labels(key), value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down, either set directly or read from a function at scrape time."""
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def set_function(self, function, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = function
+
+    def samples(self):
+        for suffix, labels, value in super().samples():
+            yield suffix, labels, value() if callable(value) else value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str, help: str, labels=(), buckets=BUCKETS, registry: Registry = REGISTRY):
+        super().__init__(name, help, labels, registry)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # per bucket counts, then the sum of the observed values
+                counts = self.values[key] = [0] * len(self.buckets) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self.lock:
+            values = sorted((key, list(counts)) for key, counts in self.values.items())
+        for key, counts in values:
+            labels = self._labels(key)
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                yield '_bucket', labels + [('le', format_value(bound))], total
+            yield '_sum', labels, counts[-1]
+            yield '_count', labels, total
+
+
+def timed(request, histogram: Histogram, **labels):
+    """Wrap a request function so that the duration of every call is observed in `histogram`."""
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return request(*args, **kwargs)
+        finally:
+            histogram.observe(perf_counter() - start, **labels)
+    return wrapper
+
+
+ROUNDS = Counter('indexer_rounds_processed_total', 'Rounds fully processed.', ('chain',))
+ROUND = Gauge('indexer_round', 'Last round fully processed.', ('chain',))
+CHAIN_TIP = Gauge('indexer_chain_tip_round', 'Last round committed on chain, known in follow mode.', ('chain',))
+LAG = Gauge('indexer_lag_rounds', 'Rounds between the chain tip and the last round processed.', ('chain',))
+EVENTS = Counter('indexer_events_total', 'Decoded marketplace events.', ('chain', 'type', 'currency'))
+SKIPPED = Counter('indexer_skipped_transactions_total',
+                  'Fee address app calls with a marketplace note but not the transfers or state it implies.',
+                  ('chain', 'note'))
+REQUEST_SECONDS = Histogram('indexer_request_seconds', 'Latency of algod and indexer requests.', ('chain', 'service'))
+STATE_CACHE_HIT_RATIO = Gauge('indexer_state_cache_hit_ratio', 'Hit ratio of global state lookups.', ('chain',))
+QUEUE_DEPTH = Gauge('indexer_queue_depth', 'Items waiting between two pipeline stages.', ('chain', 'queue'))
+OPEN_LISTINGS = Gauge('indexer_open_listings', 'Open sale and dutch listings in the in-memory view.', ('chain',))
+OPEN_AUCTIONS = Gauge('indexer_open_auctions', 'Open english auctions in the in-memory view.', ('chain',))
+
+
+def count_event(event):
+    EVENTS.inc(chain=event.chain, type=event.type.value, currency='' if event.currency is None else event.currency)
+
+
+def count_round(chain: str, round_num: int, previous_round: int):
+    ROUND.set(round_num, chain=chain)
+    if round_num > previous_round:
+        ROUNDS.inc(round_num - previous_round, chain=chain)
+
+
+def time_requests(client, name: str, **labels):
+    """Time the requests of a client, without the waits of the scheduler they are routed through."""
+    request = getattr(client, name)
+    if hasattr(request, 'request'):
+        # routed through scheduler.schedule, time the raw request the scheduler calls
+        request.request = timed(request.request, REQUEST_SECONDS, **labels)
+    else:
+        setattr(client, name, timed(request, REQUEST_SECONDS, **labels))
+
+
+def instrument(network):
+    """Time every algod and indexer request of a network and expose its state cache hit ratio."""
+    time_requests(network.client, 'algod_request', chain=network.chain, service='algod')
+    time_requests(network.indexer_client, 'indexer_request', chain=network.chain, service='indexer')
+    cache = network.state_cache
+    STATE_CACHE_HIT_RATIO.set_function(lambda: cache.hits / max(cache.hits + cache.misses, 1), chain=network.chain)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int, host: str = '127.0.0.1', registry: Registry = REGISTRY):
+    """Serve `registry` on http://host:port/metrics from a daemon thread and return the server."""
+    handler = type('Handler', (MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
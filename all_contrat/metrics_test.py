@@ -0,0 +1,73 @@
+import asyncio
+from urllib.request import urlopen
+
+from all_contrat import metrics, pipeline
+from all_contrat.fixtures import sample_transactions, sample_context
+from all_contrat.indexer import Network
+from all_contrat.networks import PROFILES
+from all_contrat.pipeline_test import ListSink
+
+
+def test_render_counter_and_histogram():
+    registry = metrics.Registry()
+    counter = metrics.Counter('sales_total', 'Sales.', ('currency',), registry=registry)
+    histogram = metrics.Histogram('latency_seconds', 'Latency.', buckets=(0.1, 1), registry=registry)
+    counter.inc(currency=0)
+    counter.inc(2, currency=0)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    assert registry.render().splitlines() == [
+        '# HELP sales_total Sales.',
+        '# TYPE sales_total counter',
+        'sales_total{currency="0"} 3',
+        '# HELP latency_seconds Latency.',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 2',
+        'latency_seconds_sum 0.55',
+        'latency_seconds_count 2',
+    ]
+
+
+def test_pipeline_metrics_are_served():
+    transactions = sample_transactions(30)
+    # a chain of its own, so counters of other tests do not add up here
+    network = Network(PROFILES['voi:testnet']._replace(chain='voi:metrics'))
+    network.fetch_page = lambda *args: (transactions, None)
+    network.context = sample_context()
+    network.context.chain = network.chain
+    asyncio.run(pipeline.run_pipeline(1, 5, sink=ListSink(), network=network))
+    server = metrics.serve(0)
+    try:
+        body = urlopen('http://127.0.0.1:%d/metrics' % server.server_port).read().decode()
+    finally:
+        server.shutdown()
+    assert 'indexer_round{chain="voi:metrics"} 5' in body
+    assert 'indexer_rounds_processed_total{chain="voi:metrics"} 5' in body
+    assert 'indexer_queue_depth{chain="voi:metrics",queue="pages"} 0' in body
+    assert sum(int(line.split()[-1]) for line in body.splitlines()
+               if line.startswith('indexer_events_total{chain="voi:metrics"')) == 30
+
+
+def test_request_latency_excludes_scheduler_waits(monkeypatch):
+    from time import sleep
+
+    from algosdk.v2client.indexer import IndexerClient
+
+    from all_contrat.scheduler import schedule
+
+    class SlowScheduler:
+        # stands in for the token bucket and backoff sleeps
+        def call(self, request, *args, **kwargs):
+            sleep(0.2)
+            return request(*args, **kwargs)
+
+    monkeypatch.setattr(IndexerClient, 'indexer_request', lambda self, *args, **kwargs: {})
+    network = Network(PROFILES['voi:testnet']._replace(chain='voi:latency'))
+    schedule(network.indexer_client, SlowScheduler())
+    metrics.instrument(network)
+    network.indexer_client.search_transactions_by_address('ADDRESS', min_round=1, max_round=2)
+    counts = metrics.REQUEST_SECONDS.values[('voi:latency', 'indexer')]
+    assert sum(counts[:-1]) == 1
+    assert counts[-1] < 0.1
@@ -0,0 +1,25 @@
+from typing import NamedTuple
+
+from all_contrat.constants import FEES_ADDRESS
+
+
+class NetworkProfile(NamedTuple):
+    chain: str
+    algod_address: str
+    indexer_address: str
+    fees_address: str = FEES_ADDRESS
+    token: str = ""
+
+
+PROFILES = {
+    'voi:testnet': NetworkProfile(
+        chain='voi:testnet',
+        algod_address="https://testnet-api.voi.nodly.io:443",
+        indexer_address="https://testnet-idx.voi.nodly.io",
+    ),
+    'voi:mainnet': NetworkProfile(
+        chain='voi:mainnet',
+        algod_address="https://mainnet-api.voi.nodly.io:443",
+        indexer_address="https://mainnet-idx.voi.nodly.io",
+    ),
+}
@@ -0,0 +1,296 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from all_contrat.auctions import AuctionBook
+from all_contrat.decoders import decode_dispatched, dispatch
+from all_contrat.dedupe import Deduplicator
+from all_contrat.listings import ActiveListings
+from all_contrat.recording import record_to, replay_from
+from all_contrat.sinks import Sink, PrintSink, SqliteSink, TeeSink
+from all_contrat import indexer, metrics
+from all_contrat.networks import PROFILES
+
+
+DONE = None
+
+
+class PageEnd:
+    """Marker following the events of one page, carrying the cursor to commit after them."""
+    __slots__ = ('round', 'next_token')
+
+    def __init__(self, round_num: int, next_token: str):
+        self.round = round_num
+        self.next_token = next_token
+
+
+async def fetch_stage(loop, executor, pages: asyncio.Queue, fetch_page, address: str, min_round: int,
+                      max_round: int, next_page: str = None):
+    try:
+        while True:
+            transactions, next_page = await loop.run_in_executor(
+                executor, fetch_page, address, min_round, max_round, next_page
+            )
+            await pages.put((transactions, next_page))
+            if not next_page:
+                break
+    finally:
+        # let the pages already fetched reach the checkpoint even if fetching failed
+        await pages.put(DONE)
+
+
+async def decode_stage(pages: asyncio.Queue, decoded: asyncio.Queue, observe, context, min_round: int,
+                       max_round: int, dedupe=None):
+    round_num = min_round - 1
+    while True:
+        page = await pages.get()
+        if page is DONE:
+            break
+        transactions, next_page = page
+        for transaction in transactions:
+            observe(transaction)
+            dispatched = dispatch(transaction, context)
+            # duplicates are dropped here, before the enrichment stage spends state lookups on them
+            if dispatched is not None and (dedupe is None or dedupe.admit(transaction['id'])):
+                await decoded.put((transaction, dispatched))
+        # pages end on a round boundary, the token is the first round of the next one
+        round_num = int(next_page) - 1 if next_page else max_round
+        await decoded.put(PageEnd(round_num, next_page))
+    await decoded.put(DONE)
+
+
+async def enrich_stage(loop, executor, decoded: asyncio.Queue, enriched: asyncio.Queue, context, concurrency: int):
+    # Decoders may block on state and program lookups, so up to `concurrency` of them run at once in the
+    # executor. Futures are queued in arrival order so the sink still sees events in round order.
+    semaphore = asyncio.Semaphore(concurrency)
+    while True:
+        item = await decoded.get()
+        if item is DONE:
+            break
+        if isinstance(item, PageEnd):
+            await enriched.put(item)
+            continue
+        transaction, dispatched = item
+        await semaphore.acquire()
+        future = loop.run_in_executor(executor, decode_dispatched, transaction, dispatched, context)
+        future.add_done_callback(lambda _: semaphore.release())
+        await enriched.put(future)
+    await enriched.put(DONE)
+
+
+async def sink_stage(enriched: asyncio.Queue, sink, min_round: int, max_round: int, chain: str = ''):
+    round_num = min_round - 1
+    while True:
+        item = await enriched.get()
+        if item is DONE:
+            break
+        if isinstance(item, PageEnd):
+            sink.advance(item.round, min_round, max_round, item.next_token)
+            metrics.count_round(chain, item.round, round_num)
+            round_num = max(round_num, item.round)
+            continue
+        event = await item
+        if event is None:
+            # the app does not run the contract its note claims
+            continue
+        metrics.count_event(event)
+        await sink.publish(event)
+    sink.flush()
+
+
+async def run_pipeline(
+    min_round: int,
+    max_round: int,
+    sink: Sink = None,
+    concurrency: int = 8,
+    queue_size: int = 4,
+    network: indexer.Network = None,
+    address: str = None,
+    fetch_page=None,
+    dedupe: Deduplicator = None,
+):
+    """Index [min_round, max_round] with overlapping fetch, decode, enrichment and sink stages.
+
+    Args:
+        min_round: First round to index.
+        max_round: Last round to index (inclusive).
+        sink: Receives every decoded event, in round order, and the cursor after every page.
+            Defaults to printing the events. A run resumes from the cursor the sink returns.
+        concurrency: Maximum number of events being enriched (and waiting on state lookups) at once.
+        queue_size: Number of pages buffered between the fetch and decode stages.
+        network: The chain to index, defaults to voi:testnet. Its state cache and decode context
+            are used by this run only, so several networks can run side by side.
+        address: The fees address whose transactions are indexed, defaults to the network's.
+        fetch_page: Page source, network.fetch_page (the default) or network.fetch_block_page.
+        dedupe: Drops the transactions whose events were already written, see dedupe.Deduplicator.
+    """
+    if sink is None:
+        sink = PrintSink()
+    if network is None:
+        network = indexer.get_network()
+    if address is None:
+        address = network.fees_address
+    if fetch_page is None:
+        fetch_page = network.fetch_page
+    min_round, next_page = sink.resume(min_round, max_round)
+    if min_round > max_round:
+        # the range was already indexed, leave the cursor where it is
+        return
+    loop = asyncio.get_running_loop()
+    pages = asyncio.Queue(queue_size)
+    decoded = asyncio.Queue(queue_size * indexer.PAGE_LIMIT)
+    enriched = asyncio.Queue(concurrency)
+    for name, queue in (('pages', pages), ('decoded', decoded), ('enriched', enriched)):
+        metrics.QUEUE_DEPTH.set_function(queue.qsize, chain=network.chain, queue=name)
+    with ThreadPoolExecutor(max_workers=concurrency + 1) as executor:
+        fetch = asyncio.ensure_future(fetch_stage(loop, executor, pages, fetch_page, address, min_round, max_round, next_page))
+        tasks = [
+            fetch,
+            asyncio.ensure_future(decode_stage(pages, decoded, network.observe, network.context, min_round, max_round, dedupe)),
+            asyncio.ensure_future(enrich_stage(loop, executor, decoded, enriched, network.context, concurrency)),
+            asyncio.ensure_future(sink_stage(enriched, sink, min_round, max_round, network.chain)),
+        ]
+        pending = tasks
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+            # a failed fetch still drains what it fetched; any other failure would stall the queues
+            if any(task is not fetch and task.exception() is not None for task in done):
+                for task in pending:
+                    task.cancel()
+                await asyncio.wait(pending)
+                break
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+
+
+def with_views(sink: Sink, network: indexer.Network):
+    """Tee the in-memory views of the open listings and auctions behind a sink and export their size.
+
+    The views are seeded with the events an SQLite sink already holds, so a resumed run knows the
+    listings created before it.
+    """
+    listings = ActiveListings(network.context.dutch_auctions)
+    auctions = AuctionBook()
+    if isinstance(sink, SqliteSink):
+        for event in sink.stored_events(network.chain):
+            listings.write(event)
+            auctions.write(event)
+    metrics.OPEN_LISTINGS.set_function(lambda: len(listings), chain=network.chain)
+    metrics.OPEN_AUCTIONS.set_function(lambda: len(auctions), chain=network.chain)
+    # the first sink keeps the cursor
+    return TeeSink(sink, listings, auctions)
+
+
+async def run_networks(jobs, concurrency: int = 8, queue_size: int = 4, source: str = 'indexer', dedupe: bool = True):
+    """Index several networks concurrently in one process, each with its own pipeline.
+
+    Args:
+        jobs: (network, min_round, max_round, sink) tuples. Each sink keeps its own cursor, so
+            networks resume independently; a failure on one network does not stop the others.
+        concurrency: Enrichment concurrency of each pipeline.
+        queue_size: Page buffer of each pipeline.
+        source: 'indexer' to page through the indexer, 'algod' to read blocks from algod.
+        dedupe: Skip transactions whose events each sink already holds.
+    """
+    results = await asyncio.gather(
+        *(
+            run_pipeline(
+                min_round,
+                max_round,
+                sink=sink,
+                concurrency=concurrency,
+                queue_size=queue_size,
+                network=network,
+                fetch_page=network.fetch_block_page if source == 'algod' else network.fetch_page,
+                dedupe=Deduplicator(sink) if dedupe else None,
+            )
+            for network, min_round, max_round, sink in jobs
+        ),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Index marketplace events with the asyncio pipeline.')
+    parser.add_argument('--min-round', type=int)
+    parser.add_argument('--max-round', type=int)
+    parser.add_argument('--chain', choices=sorted(PROFILES), default=indexer.DEFAULT_CHAIN)
+    parser.add_argument('--network', nargs=3, action='append', metavar=('CHAIN', 'MIN_ROUND', 'MAX_ROUND'),
+                        help='index a chain over a round range, repeat to index several networks at once')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--database', default='indexer.sqlite', help='SQLite file holding the events and the cursor')
+    parser.add_argument('--flush-size', type=int, default=5000)
+    parser.add_argument('--flush-interval', type=float, default=1.0)
+    parser.add_argument('--source', choices=('indexer', 'algod'), default='indexer',
+                        help='read fee address transactions from the indexer or straight from algod blocks')
+    parser.add_argument('--fingerprints', help='only decode apps whose approval program has a fingerprint in this '
+                                                 'JSON file, see fingerprints.py')
+    parser.add_argument('--no-dedupe', action='store_true', help='do not skip transactions already in the database')
+    parser.add_argument('--parquet', help='also write the events to a Parquet dataset rooted at this directory')
+    parser.add_argument('--metrics-port', type=int, help='serve Prometheus metrics on this port at /metrics')
+    parser.add_argument('--views', action='store_true', help='keep in-memory views of the open listings and '
+                                                             'auctions, their size is exported as metrics')
+    parser.add_argument('--record', help='write every algod/indexer response to this .jsonl.gz file')
+    parser.add_argument('--replay', help='serve algod/indexer responses from this .jsonl.gz recording, offline')
+    args = parser.parse_args()
+
+    if args.network:
+        ranges = [(chain, int(min_round), int(max_round)) for chain, min_round, max_round in args.network]
+    elif args.min_round is not None and args.max_round is not None:
+        ranges = [(args.chain, args.min_round, args.max_round)]
+    else:
+        parser.error('either --min-round and --max-round or --network is required')
+    for chain, _, _ in ranges:
+        if chain not in PROFILES:
+            parser.error('unknown chain %s, expected one of %s' % (chain, ', '.join(sorted(PROFILES))))
+    if (args.record or args.replay) and len(ranges) > 1:
+        parser.error('--record and --replay support a single network')
+
+    networks = [indexer.get_network(chain) for chain, _, _ in ranges]
+    if args.fingerprints:
+        for network in networks:
+            network.verify_programs(args.fingerprints)
+    recorder = None
+    if args.record:
+        recorder = record_to(args.record, networks[0])
+    if args.replay:
+        replay_from(args.replay, networks[0])
+
+    if args.metrics_port:
+        for network in networks:
+            metrics.instrument(network)
+        metrics.serve(args.metrics_port)
+
+    # one cursor per chain in the same database
+    databases = [SqliteSink(args.database, network.chain, args.flush_size, args.flush_interval) for network in networks]
+    jobs = [(network, min_round, max_round, database)
+            for network, (_, min_round, max_round), database in zip(networks, ranges, databases)]
+    if args.views:
+        jobs = [(network, min_round, max_round, with_views(sink, network))
+                for network, min_round, max_round, sink in jobs]
+    if args.parquet:
+        # pyarrow and numpy are only needed for the export
+        from all_contrat.export import ParquetSink
+
+        parquets = [ParquetSink(args.parquet, network.chain) for network in networks]
+        for parquet, database in zip(parquets, databases):
+            # the database commits cursors before the Parquet files roll, the last run may have stopped in between
+            saved = database.checkpoint.load()
+            parquet.catch_up(database.stored_events(parquet.chain, parquet.round),
+                             saved[0] if saved is not None else parquet.round)
+        # the SQLite sink comes first and keeps the cursor
+        jobs = [(network, min_round, max_round, TeeSink(sink, parquet))
+                for (network, min_round, max_round, sink), parquet in zip(jobs, parquets)]
+    try:
+        asyncio.run(run_networks(jobs, concurrency=args.concurrency, source=args.source,
+                                 dedupe=not args.no_dedupe))
+    finally:
+        for _, _, _, sink in jobs:
+            sink.close()
+        if recorder is not None:
+            recorder.close()
@@ -0,0 +1,190 @@
+import asyncio
+
+import pytest
+
+from all_contrat import pipeline
+from all_contrat.indexer import Network
+from all_contrat.networks import PROFILES
+from all_contrat.sinks import Sink, SqliteSink
+from all_contrat.fixtures import sample_transaction, sample_transactions, sample_context
+
+
+def sample_network(fetch_page, chain='voi:testnet'):
+    network = Network(PROFILES[chain])
+    network.fetch_page = fetch_page
+    network.context = sample_context(chain)
+    return network
+
+
+class ListSink(Sink):
+
+    def __init__(self):
+        self.events = []
+
+    def write(self, event):
+        self.events.append(event)
+
+
+def test_pipeline_keeps_round_order():
+    transactions = sample_transactions(2500)
+    pages = [transactions[:1000], transactions[1000:2000], transactions[2000:]]
+
+    def fetch_page(address, min_round, max_round, next_page):
+        i = int(next_page or 0)
+        return pages[i], (str(i + 1) if i + 1 < len(pages) else None)
+
+    sink = ListSink()
+    asyncio.run(pipeline.run_pipeline(1, 2, sink=sink, concurrency=4, network=sample_network(fetch_page)))
+    assert [event.id for event in sink.events] == [transaction['id'] for transaction in transactions]
+
+
+def test_pipeline_resumes_from_checkpoint(tmp_path):
+    transactions = sample_transactions(2500)
+    pages = [transactions[:1000], transactions[1000:2000], transactions[2000:]]
+    fetched = []
+
+    def fetch_page(address, min_round, max_round, next_page):
+        i = int(next_page or 0)
+        fetched.append(i)
+        if len(fetched) == 3 and i == 2:
+            raise TimeoutError()
+        return pages[i], (str(i + 1) if i + 1 < len(pages) else None)
+
+    network = sample_network(fetch_page)
+    sink = SqliteSink(str(tmp_path / 'indexer.sqlite'), flush_size=100, flush_interval=0)
+    with pytest.raises(TimeoutError):
+        asyncio.run(pipeline.run_pipeline(1, 2, sink=sink, network=network))
+    assert sink.checkpoint.load()[3] == '2'
+
+    asyncio.run(pipeline.run_pipeline(1, 2, sink=sink, network=network))
+    assert fetched == [0, 1, 2, 2]
+    assert sink.checkpoint.load() == (2, 1, 2, None)
+    assert sink.connection.execute('SELECT COUNT(*) FROM events').fetchone()[0] == 2500
+
+    # rerunning the finished range fetches nothing and keeps the cursor
+    asyncio.run(pipeline.run_pipeline(1, 2, sink=sink, network=network))
+    assert fetched == [0, 1, 2, 2]
+    assert sink.checkpoint.load() == (2, 1, 2, None)
+    sink.close()
+
+
+def test_pipeline_skips_transactions_that_do_not_fit_their_note():
+    from all_contrat import metrics
+
+    transactions = [sample_transaction('sale,buy,200/72', i) for i in range(100)]
+    transactions[50]['inner-txns'] = transactions[50]['inner-txns'][-1:]
+    skipped = metrics.SKIPPED.values.get(('voi:testnet', 'sale,buy,200/72'), 0)
+
+    network = sample_network(lambda address, min_round, max_round, next_page: (transactions, None))
+    sink = ListSink()
+    asyncio.run(pipeline.run_pipeline(1, 2, sink=sink, network=network))
+    assert len(sink.events) == 99
+    assert metrics.SKIPPED.values[('voi:testnet', 'sale,buy,200/72')] == skipped + 1
+
+
+def test_networks_index_side_by_side(tmp_path):
+    testnet = [sample_transaction('sale,buy,1/72', i) for i in range(10)]
+    mainnet = [sample_transaction('sale,buy,200/72', i) for i in range(20)]
+    for transaction in mainnet:
+        transaction['id'] = 'MAIN' + transaction['id']
+    path = str(tmp_path / 'indexer.sqlite')
+    jobs = [
+        (sample_network(lambda *args: (testnet, None)), 1, 2, SqliteSink(path, 'voi:testnet', flush_interval=0)),
+        (sample_network(lambda *args: (mainnet, None), 'voi:mainnet'), 5, 9,
+         SqliteSink(path, 'voi:mainnet', flush_interval=0)),
+    ]
+    asyncio.run(pipeline.run_networks(jobs))
+    assert jobs[0][3].checkpoint.load() == (2, 1, 2, None)
+    assert jobs[1][3].checkpoint.load() == (9, 5, 9, None)
+    chains = jobs[0][3].connection.execute('SELECT chain, COUNT(*) FROM events GROUP BY chain ORDER BY chain')
+    assert chains.fetchall() == [('voi:mainnet', 20), ('voi:testnet', 10)]
+    for _, _, _, sink in jobs:
+        sink.close()
+
+
+def test_pipeline_classifies_apps_off_the_event_loop():
+    from base64 import b64encode
+    from threading import get_ident
+
+    from all_contrat.fingerprints import ProgramClassifier
+
+    program = b'\x0a\x20sale voi arc72'
+    lookups = []
+
+    def fetch_program(app_id):
+        lookups.append((app_id, get_ident()))
+        return b'\x0a\x20something else'
+
+    creation = sample_transaction('sale,buy,1/72', 0)
+    creation['created-application-index'] = 1000
+    creation['application-transaction']['approval-program'] = b64encode(program).decode()
+    transactions = [creation, sample_transaction('sale,buy,1/72', 1)]
+    network = sample_network(lambda address, min_round, max_round, next_page: (transactions, None))
+    network.classifier = ProgramClassifier(fetch_program)
+    network.classifier.add(program, 'sale', '1/72')
+    network.context.classify = network.classifier.classify
+
+    async def run():
+        await pipeline.run_pipeline(1, 2, sink=sink, network=network)
+        return get_ident()
+
+    sink = ListSink()
+    loop_thread = asyncio.run(run())
+    # the creation is classified from its own program, the other app with a lookup in the executor
+    assert [event.id for event in sink.events] == ['TX0']
+    assert [app_id for app_id, _ in lookups] == [1001]
+    assert all(thread != loop_thread for _, thread in lookups)
+
+
+def test_views_are_seeded_from_the_database_and_follow_new_events(tmp_path):
+    from all_contrat import metrics
+
+    creates = [sample_transaction(note, i) for i, note in enumerate(('sale,create,1/72', 'auction,create,1/72'))]
+    network = sample_network(lambda address, min_round, max_round, next_page: (creates, None))
+    sink = SqliteSink(str(tmp_path / 'indexer.sqlite'), flush_interval=0)
+    asyncio.run(pipeline.run_pipeline(1, 2, sink=sink, network=network))
+
+    buy = sample_transaction('sale,buy,1/72', 0)
+    buy['id'] = 'TXBUY'
+    network.fetch_page = lambda address, min_round, max_round, next_page: ([buy], None)
+    sink = pipeline.with_views(sink, network)
+    _, listings, auctions = sink.sinks
+    assert (len(listings), len(auctions)) == (1, 1)
+    asyncio.run(pipeline.run_pipeline(3, 4, sink=sink, network=network))
+    assert (len(listings), len(auctions)) == (0, 1)
+    assert metrics.OPEN_AUCTIONS.values[('voi:testnet',)]() == 1
+    sink.close()
+
+
+def test_pipeline_scans_descending_address_pages_in_round_order(monkeypatch, tmp_path):
+    from all_contrat import indexer
+
+    monkeypatch.setattr(indexer, 'ROUND_WINDOW', 10)
+    monkeypatch.setattr(indexer, 'PAGE_LIMIT', 4)
+    transactions = [sample_transaction('sale,buy,1/72', i, round_num=1 + i // 3) for i in range(150)]
+    requests = []
+
+    def search_transactions_by_address(address, limit, next_page, min_round, max_round):
+        # like the indexer, newest first
+        requests.append((min_round, next_page))
+        if len(requests) == 12:
+            raise TimeoutError()
+        matching = [tx for tx in reversed(transactions) if min_round <= tx['confirmed-round'] <= max_round]
+        offset = int(next_page or 0)
+        page = matching[offset:offset + limit]
+        return {'transactions': page, 'next-token': str(offset + limit) if page else None}
+
+    network = sample_network(None)
+    del network.fetch_page
+    network.indexer_client.search_transactions_by_address = search_transactions_by_address
+    sink = SqliteSink(str(tmp_path / 'indexer.sqlite'), flush_size=1000, flush_interval=0)
+    with pytest.raises(TimeoutError):
+        asyncio.run(pipeline.run_pipeline(1, 50, sink=sink, network=network))
+    # the first window is complete, the second one is read again
+    assert sink.checkpoint.load() == (10, 1, 50, '11')
+
+    asyncio.run(pipeline.run_pipeline(1, 50, sink=sink, network=network))
+    ids = sink.connection.execute('SELECT id FROM events ORDER BY rowid').fetchall()
+    assert [id for id, in ids] == [transaction['id'] for transaction in transactions]
+    assert sink.checkpoint.load() == (50, 1, 50, None)
+    sink.close()
@@ -0,0 +1,156 @@
+import gzip
+import json
+import os
+import zlib
+from base64 import b64decode, b64encode
+from threading import Lock
+from time import monotonic
+from urllib.parse import urlencode
+
+from algosdk.v2client.algod import AlgodClient
+from algosdk.v2client.indexer import IndexerClient
+
+from all_contrat.scheduler import schedule
+
+
+def request_key(service: str, method: str, requrl: str, params=None):
+    if params:
+        items = params.items() if isinstance(params, dict) else params
+        requrl = requrl + '?' + urlencode(sorted((key, str(value)) for key, value in items))
+    return '%s %s %s' % (service, method.upper(), requrl)
+
+
+def complete_lines(path: str):
+    """Return the complete lines of a gzip file and whether the file ends with its gzip trailer.
+
+    A file whose writer crashed ends without the trailer, possibly mid line or mid block.
+    """
+    lines = []
+    with gzip.open(path, 'rt') as file:
+        try:
+            for line in file:
+                if not line.endswith('\n'):
+                    return lines, False
+                lines.append(line)
+        except (EOFError, zlib.error, gzip.BadGzipFile):
+            return lines, False
+    return lines, True
+
+
+class Recorder:
+    """Appends request/response pairs to a gzip compressed JSONL file.
+
+    Lines are flushed every `flush_interval` seconds, so a crash loses at most that much of the
+    recording; the gzip trailer is only written by `close`, see Recording for reading without it.
+    A gzip member appended after an unterminated one could not be read, so a recording left
+    without its trailer is first rewritten with its complete lines.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        if os.path.exists(path):
+            lines, terminated = complete_lines(path)
+            if not terminated:
+                with gzip.open(path + '.tmp', 'wt') as file:
+                    file.writelines(lines)
+                os.replace(path + '.tmp', path)
+        self.file = gzip.open(path, 'at')
+        self.flush_interval = flush_interval
+        self.last_flush = monotonic()
+        self.lock = Lock()
+
+    def record(self, key: str, response):
+        if isinstance(response, bytes):
+            line = {'key': key, 'bytes': b64encode(response).decode()}
+        else:
+            line = {'key': key, 'json': response}
+        with self.lock:
+            self.file.write(json.dumps(line) + '\n')
+            if monotonic() - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = monotonic()
+
+    def close(self):
+        self.file.close()
+
+
+class Recording:
+    """Responses of a recording file by request key; the last response wins for repeated requests.
+
+    A recording whose writer crashed ends without the gzip trailer, possibly mid line; the complete
+    lines before that are kept.
+    """
+
+    def __init__(self, path: str):
+        self.responses = dict()
+        for line in complete_lines(path)[0]:
+            entry = json.loads(line)
+            self.responses[entry['key']] = b64decode(entry['bytes']) if 'bytes' in entry else entry['json']
+
+    def get(self, key: str):
+        if key not in self.responses:
+            raise Exception(f"No recorded response for {key}")
+        return self.responses[key]
+
+
+class RecordingAlgodClient(AlgodClient):
+
+    def __init__(self, recorder: Recorder, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recorder = recorder
+
+    def algod_request(self, method, requrl, params=None, data=None, headers=None, response_format="json", timeout=30):
+        response = super().algod_request(method, requrl, params, data, headers, response_format, timeout)
+        self.recorder.record(request_key('algod', method, requrl, params), response)
+        return response
+
+
+class RecordingIndexerClient(IndexerClient):
+
+    def __init__(self, recorder: Recorder, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recorder = recorder
+
+    def indexer_request(self, method, requrl, params=None, data=None, headers=None, timeout=30):
+        response = super().indexer_request(method, requrl, params, data, headers, timeout)
+        self.recorder.record(request_key('indexer', method, requrl, params), response)
+        return response
+
+
+class ReplayAlgodClient(AlgodClient):
+
+    def __init__(self, recording: Recording):
+        super().__init__('', 'http://replay')
+        self.recording = recording
+
+    def algod_request(self, method, requrl, params=None, data=None, headers=None, response_format="json", timeout=30):
+        return self.recording.get(request_key('algod', method, requrl, params))
+
+
+class ReplayIndexerClient(IndexerClient):
+
+    def __init__(self, recording: Recording):
+        super().__init__('', 'http://replay')
+        self.recording = recording
+
+    def indexer_request(self, method, requrl, params=None, data=None, headers=None, timeout=30):
+        return self.recording.get(request_key('indexer', method, requrl, params))
+
+
+def record_to(path: str, network):
+    """Route the algod and indexer clients of a network through a recorder writing to `path`."""
+    recorder = Recorder(path)
+    algod = network.client
+    network.client = schedule(RecordingAlgodClient(recorder, algod.algod_token, algod.algod_address, algod.headers))
+    idx = network.indexer_client
+    network.indexer_client = schedule(
+        RecordingIndexerClient(recorder, idx.indexer_token, idx.indexer_address, idx.headers)
+    )
+    return recorder
+
+
+def replay_from(path: str, network):
+    """Serve the algod and indexer requests of a network from the recording at `path`, without network."""
+    recording = Recording(path)
+    network.client = ReplayAlgodClient(recording)
+    network.indexer_client = ReplayIndexerClient(recording)
+    return recording
@@ -0,0 +1,61 @@
+from algosdk.v2client.algod import AlgodClient
+from algosdk.v2client.indexer import IndexerClient
+
+from all_contrat.recording import (Recorder, Recording, RecordingAlgodClient, RecordingIndexerClient,
+                                   ReplayAlgodClient, ReplayIndexerClient)
+
+
+def test_record_then_replay(monkeypatch, tmp_path):
+    page = {'transactions': [{'id': 'TX0'}], 'next-token': 'abc'}
+    block = b'\x81\xa5block\x80'
+    monkeypatch.setattr(IndexerClient, 'indexer_request', lambda self, *args, **kwargs: page)
+    monkeypatch.setattr(AlgodClient, 'algod_request', lambda self, *args, **kwargs: block)
+
+    path = str(tmp_path / 'traffic.jsonl.gz')
+    recorder = Recorder(path)
+    RecordingIndexerClient(recorder, '', 'http://idx').search_transactions_by_address(
+        'ADDRESS', min_round=1, max_round=2, limit=1000)
+    RecordingAlgodClient(recorder, '', 'http://algod').block_info(round_num=7, response_format='msgpack')
+    recorder.close()
+    monkeypatch.undo()
+
+    recording = Recording(path)
+    assert ReplayIndexerClient(recording).search_transactions_by_address(
+        'ADDRESS', max_round=2, min_round=1, limit=1000) == page
+    assert ReplayAlgodClient(recording).block_info(round_num=7, response_format='msgpack') == block
+
+
+def test_recording_without_trailer_keeps_complete_lines(tmp_path):
+    path = str(tmp_path / 'traffic.jsonl.gz')
+    recorder = Recorder(path, flush_interval=0)
+    for i in range(3):
+        recorder.record('indexer GET /v2/transactions?round=%d' % i, {'round': i})
+    # the process dies before close writes the gzip trailer
+    with open(path, 'rb') as file:
+        data = file.read()
+    recorder.close()
+    crashed = tmp_path / 'crashed.jsonl.gz'
+    crashed.write_bytes(data)
+
+    recording = Recording(str(crashed))
+    assert recording.get('indexer GET /v2/transactions?round=2') == {'round': 2}
+    assert len(recording.responses) == 3
+
+
+def test_recording_continues_after_a_crash(tmp_path):
+    path = str(tmp_path / 'traffic.jsonl.gz')
+    recorder = Recorder(path, flush_interval=0)
+    for i in range(3):
+        recorder.record('indexer GET /v2/transactions?round=%d' % i, {'round': i})
+    with open(path, 'rb') as file:
+        data = file.read()
+    recorder.close()
+    crashed = tmp_path / 'crashed.jsonl.gz'
+    crashed.write_bytes(data)
+
+    # the next run records to the same file
+    recorder = Recorder(str(crashed))
+    recorder.record('indexer GET /v2/transactions?round=3', {'round': 3})
+    recorder.close()
+    recording = Recording(str(crashed))
+    assert len(recording.responses) == 4
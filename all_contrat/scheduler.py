@@ -0,0 +1,146 @@
+import random
+import re
+from socket import timeout as SocketTimeout
+from threading import Condition, Lock
+from time import monotonic, sleep
+from urllib.error import HTTPError, URLError
+
+from algosdk.error import AlgodHTTPError, IndexerHTTPError
+from algosdk.v2client.algod import AlgodClient
+
+
+# only when the status is lost, throttling and gateway errors are told apart by the start of their body
+OVERLOAD_MESSAGE = re.compile(r'^\s*(429|50[234])\b|too many requests|rate limit|bad gateway|service unavailable|'
+                              r'gateway time', re.IGNORECASE)
+
+
+def http_status(error: Exception):
+    """HTTP status of a failed request, also of IndexerHTTPError which is raised while handling the HTTPError."""
+    while error is not None:
+        if isinstance(error, HTTPError):
+            return error.code
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def is_overload(error: Exception):
+    """Whether a failed request means the endpoint is throttling or overloaded, so it is worth retrying slower."""
+    if isinstance(error, AlgodHTTPError):
+        return error.code is not None and (error.code == 429 or error.code >= 500)
+    if isinstance(error, (IndexerHTTPError, HTTPError)):
+        code = http_status(error)
+        if code is not None:
+            return code == 429 or code >= 500
+        return OVERLOAD_MESSAGE.search(str(error)) is not None
+    return isinstance(error, (URLError, SocketTimeout, ConnectionError))
+
+
+class RequestScheduler:
+    """Token bucket plus AIMD concurrency window in front of one endpoint.
+
+    Requests wait for a token, refilled at `rate` per second, and for a free slot among `limit`
+    concurrent requests. Every success raises the rate and the window additively, every overload
+    (429, 5xx, timeouts) halves both and the request is retried after an exponential backoff, so
+    the scheduler settles just under the throughput the endpoint actually allows.
+
+    Args:
+        rate: Initial requests per second.
+        limit: Initial number of concurrent requests.
+        min_rate: Floor of the rate after backoffs.
+        max_rate: Ceiling of the rate.
+        max_limit: Ceiling of the concurrency window.
+        retries: Attempts of a request on overload before the error is raised.
+        backoff: Seconds before the first retry, doubled on each further attempt.
+    """
+
+    def __init__(self, rate: float = 20.0, limit: float = 4, min_rate: float = 1.0, max_rate: float = 500.0,
+                 max_limit: int = 64, retries: int = 6, backoff: float = 0.5):
+        self.rate = rate
+        self.limit = limit
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_limit = max_limit
+        self.retries = retries
+        self.backoff = backoff
+        self.tokens = 1.0
+        self.updated = monotonic()
+        self.in_flight = 0
+        self.throttled = 0
+        self.condition = Condition()
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, max(self.rate, 1.0))
+        self.updated = now
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                self._refill()
+                if self.tokens >= 1 and self.in_flight < int(self.limit):
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+                wait = (1 - self.tokens) / self.rate if self.tokens < 1 else None
+                self.condition.wait(wait)
+
+    def release(self, overloaded: bool):
+        with self.condition:
+            self.in_flight -= 1
+            if overloaded:
+                self.throttled += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.rate = min(self.max_rate, self.rate + 1 / self.limit)
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def call(self, request, *args, **kwargs):
+        """Run `request(*args, **kwargs)` within the scheduler's rate and window, retrying overloads."""
+        for attempt in range(self.retries):
+            self.acquire()
+            try:
+                response = request(*args, **kwargs)
+            except Exception as error:
+                overloaded = is_overload(error)
+                self.release(overloaded)
+                if not overloaded or attempt == self.retries - 1:
+                    raise
+                sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+                continue
+            self.release(False)
+            return response
+
+
+SCHEDULERS = dict()
+SCHEDULERS_LOCK = Lock()
+
+
+def scheduler_for(address: str):
+    """Return the scheduler shared by every client of an endpoint in this process."""
+    with SCHEDULERS_LOCK:
+        if address not in SCHEDULERS:
+            SCHEDULERS[address] = RequestScheduler()
+        return SCHEDULERS[address]
+
+
+def schedule(client, scheduler: RequestScheduler = None):
+    """Route every request of an algod or indexer client through a scheduler and return the client.
+
+    Defaults to the scheduler shared by the client's endpoint. Works on any client instance, e.g.
+    the one handed to the contracts' operations modules.
+    """
+    if isinstance(client, AlgodClient):
+        name, address = 'algod_request', client.algod_address
+    else:
+        name, address = 'indexer_request', client.indexer_address
+    if scheduler is None:
+        scheduler = scheduler_for(address)
+    def scheduled(*args, **kwargs):
+        # looked up on every call, so the raw request can still be wrapped, see metrics.instrument
+        return scheduler.call(scheduled.request, *args, **kwargs)
+
+    scheduled.request = getattr(client, name)
+    setattr(client, name, scheduled)
+    return client
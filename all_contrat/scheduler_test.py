@@ -0,0 +1,84 @@
+from threading import Thread
+from time import sleep
+
+import pytest
+from algosdk.error import AlgodHTTPError, IndexerHTTPError
+from algosdk.v2client.algod import AlgodClient
+
+from all_contrat.scheduler import RequestScheduler, is_overload, schedule
+
+
+def test_overload_halves_the_rate_and_retries():
+    scheduler = RequestScheduler(rate=100, limit=4, backoff=0.001)
+    failures = [AlgodHTTPError('Too Many Requests', code=429), IndexerHTTPError('503 Service Unavailable')]
+
+    def request(value):
+        if failures:
+            raise failures.pop(0)
+        return value
+
+    assert scheduler.call(request, 42) == 42
+    assert scheduler.throttled == 2
+    # halved twice, then one additive step for the success
+    assert scheduler.rate == 100 / 4 + 1
+    assert scheduler.limit == 2
+
+
+def test_client_errors_are_not_retried():
+    scheduler = RequestScheduler(backoff=0.001)
+    calls = []
+
+    def request():
+        calls.append(1)
+        raise AlgodHTTPError('application does not exist', code=404)
+
+    with pytest.raises(AlgodHTTPError):
+        scheduler.call(request)
+    assert len(calls) == 1
+    assert scheduler.throttled == 0
+
+
+def test_concurrency_window_is_respected(monkeypatch):
+    running = []
+    peak = []
+
+    def algod_request(self, *args, **kwargs):
+        running.append(1)
+        peak.append(len(running))
+        sleep(0.01)
+        running.pop()
+        return {'last-round': 1}
+
+    monkeypatch.setattr(AlgodClient, 'algod_request', algod_request)
+    client = schedule(AlgodClient('', 'http://algod'), RequestScheduler(rate=1000, limit=2, max_limit=2))
+    threads = [Thread(target=client.status) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 2
+
+
+def test_indexer_errors_are_told_apart_by_their_status(monkeypatch):
+    from io import BytesIO
+    from urllib.error import HTTPError
+
+    from algosdk.v2client import indexer
+
+    def failing(code, body):
+        def urlopen(request, timeout=None):
+            raise HTTPError(request.full_url, code, 'error', {}, BytesIO(body))
+        return urlopen
+
+    client = indexer.IndexerClient('', 'http://indexer')
+    # the message of a client error may hold digits of a status code
+    monkeypatch.setattr(indexer, 'urlopen', failing(404, b'{"message": "no application-id: 6450429"}'))
+    with pytest.raises(IndexerHTTPError) as error:
+        client.applications(6450429)
+    assert not is_overload(error.value)
+    monkeypatch.setattr(indexer, 'urlopen', failing(429, b'<html>slow down</html>'))
+    with pytest.raises(IndexerHTTPError) as error:
+        client.applications(6450429)
+    assert is_overload(error.value)
+    assert not is_overload(IndexerHTTPError('no application-id: 6450429'))
+    assert is_overload(IndexerHTTPError('503 Service Unavailable'))
@@ -0,0 +1,254 @@
+import sqlite3
+from time import monotonic
+
+from all_contrat.checkpoint import Checkpoint
+from all_contrat.events import Action, Kind, Market, new_market_event
+from all_contrat.fees import FeeTotals
+
+
+class Sink:
+    """Destination of decoded events.
+
+    `write` receives events in round order and may buffer them. `advance` is called after the
+    last event of every indexer page with the cursor to resume from; durable sinks persist it
+    together with the events, others ignore it. The pipeline hands events over with `publish`,
+    which sinks override when they need to wait on slow consumers.
+    """
+
+    def write(self, event):
+        raise NotImplementedError
+
+    async def publish(self, event):
+        self.write(event)
+
+    def seen(self, tx_id: str):
+        """Whether an event of this transaction was already written, for sinks that keep an id index."""
+        return False
+
+    def ids(self):
+        """Transaction ids of the events already written."""
+        return ()
+
+    def advance(self, round_num: int, min_round: int, max_round: int, next_token: str = None):
+        pass
+
+    def resume(self, min_round: int, max_round: int):
+        return min_round, None
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class PrintSink(Sink):
+
+    def write(self, event):
+        print(event.as_dict())
+
+
+class TeeSink(Sink):
+    """Hands every event and cursor to several sinks; the first one provides the resume point.
+
+    Cursors are advanced, and sinks flushed and closed, from the last sink to the first, so the
+    others have an event before the first one commits a cursor past it. Sinks that persist less
+    often catch up from the first one after a restart, see ParquetSink.
+    """
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, event):
+        for sink in self.sinks:
+            sink.write(event)
+
+    async def publish(self, event):
+        for sink in self.sinks:
+            await sink.publish(event)
+
+    def advance(self, round_num: int, min_round: int, max_round: int, next_token: str = None):
+        for sink in reversed(self.sinks):
+            sink.advance(round_num, min_round, max_round, next_token)
+
+    def resume(self, min_round: int, max_round: int):
+        return self.sinks[0].resume(min_round, max_round)
+
+    def seen(self, tx_id: str):
+        return self.sinks[0].seen(tx_id)
+
+    def ids(self):
+        return self.sinks[0].ids()
+
+    def flush(self):
+        for sink in reversed(self.sinks):
+            sink.flush()
+
+    def close(self):
+        for sink in reversed(self.sinks):
+            sink.close()
+
+
+EVENT_COLUMNS = ('id', 'round', 'created_at', 'chain', 'kind', 'app_id', 'type', 'market', 'amount', 'currency',
+                 'from_address', 'nft_app_id', 'nft_id', 'ends_at', 'fee')
+
+
+def uint_text(value):
+    return str(value) if value is not None else None
+
+
+def text_uint(value):
+    return int(value) if value is not None else None
+
+
+def event_row(event):
+    # amounts, currencies and fees are uint64 and NFT ids uint256, beyond the signed 64 bit INTEGER of SQLite
+    return (
+        event.id,
+        event.round,
+        event.created_at,
+        event.chain,
+        event.kind.value,
+        event.app_id,
+        event.type.value,
+        event.market.value,
+        uint_text(event.amount),
+        uint_text(event.currency),
+        event.from_address,
+        event.nft_app_id,
+        uint_text(event.nft_id),
+        event.end,
+        uint_text(event.fee),
+    )
+
+
+def row_event(row):
+    """Inverse of event_row, for rows read back from the events table."""
+    (tx_id, round_num, created_at, chain, kind, app_id, action, market, amount, currency, from_address, nft_app_id,
+     nft_id, ends_at, fee) = row
+    return new_market_event(tx_id, round_num, created_at, from_address, chain, app_id, Kind(kind), Action(action),
+                            Market(market), text_uint(amount), text_uint(currency), nft_app_id, text_uint(nft_id),
+                            ends_at, text_uint(fee))
+
+
+# ids per lookup, below the 999 host parameters older SQLite builds allow
+STORED_IDS_CHUNK = 900
+
+
+EVENTS_TABLE = (
+    'CREATE TABLE IF NOT EXISTS events ('
+    'id TEXT PRIMARY KEY, round INTEGER, created_at INTEGER, chain TEXT, kind TEXT, app_id INTEGER, '
+    'type TEXT, market TEXT, amount TEXT, currency TEXT, from_address TEXT, nft_app_id INTEGER, '
+    'nft_id TEXT, ends_at INTEGER, fee TEXT)'
+)
+
+
+class SqliteSink(Sink):
+    """Batched SQLite event store in WAL mode, holding the indexing checkpoint and fee totals as well.
+
+    Args:
+        path: The SQLite database file.
+        name: Name of the checkpoint cursor, usually the chain being indexed.
+        flush_size: Number of buffered events that triggers a flush.
+        flush_interval: Seconds after which buffered events are flushed even if fewer than flush_size.
+    """
+
+    def __init__(self, path: str = 'indexer.sqlite', name: str = 'voi:testnet', flush_size: int = 5000,
+                 flush_interval: float = 1.0):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute(EVENTS_TABLE)
+            columns = {column[1]: column[2] for column in self.connection.execute('PRAGMA table_info(events)')}
+            if 'fee' not in columns:
+                # databases written before fees were decoded
+                self.connection.execute('ALTER TABLE events ADD COLUMN fee INTEGER')
+            if columns['amount'] == 'INTEGER':
+                # databases written before uint64 columns were stored as text, their type cannot be altered
+                self.connection.execute('ALTER TABLE events RENAME TO integer_events')
+                self.connection.execute(EVENTS_TABLE)
+                self.connection.execute(
+                    'INSERT INTO events (%s) SELECT %s FROM integer_events' % (', '.join(EVENT_COLUMNS), ', '.join(
+                        'CAST(%s AS TEXT)' % column if column in ('amount', 'currency', 'fee') else column
+                        for column in EVENT_COLUMNS))
+                )
+                self.connection.execute('DROP TABLE integer_events')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS events_app_id ON events (app_id)')
+        self.checkpoint = Checkpoint(self.connection, name)
+        self.fees = FeeTotals(self.connection)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.events = []
+        self.pending_ids = set()
+        self.cursor = None
+        self.last_flush = monotonic()
+
+    def write(self, event):
+        self.events.append(event)
+        self.pending_ids.add(event.id)
+        if len(self.events) >= self.flush_size:
+            self.flush()
+
+    def advance(self, round_num: int, min_round: int, max_round: int, next_token: str = None):
+        self.cursor = (round_num, min_round, max_round, next_token)
+        if monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def resume(self, min_round: int, max_round: int):
+        return self.checkpoint.resume(min_round, max_round)
+
+    def seen(self, tx_id: str):
+        # the primary key of the events table is the durable id index
+        return tx_id in self.pending_ids or self.connection.execute(
+            'SELECT 1 FROM events WHERE id = ?', (tx_id,)
+        ).fetchone() is not None
+
+    def ids(self):
+        return (tx_id for tx_id, in self.connection.execute('SELECT id FROM events'))
+
+    def stored_events(self, chain: str = None, after_round: int = None):
+        """Yield the events already written, in round order, optionally of one chain or after a round only."""
+        query = 'SELECT %s FROM events WHERE 1' % ', '.join(EVENT_COLUMNS)
+        parameters = []
+        if chain is not None:
+            query += ' AND chain = ?'
+            parameters.append(chain)
+        if after_round is not None:
+            query += ' AND round > ?'
+            parameters.append(after_round)
+        for row in self.connection.execute(query + ' ORDER BY round, rowid', parameters):
+            yield row_event(row)
+
+    def stored_ids(self, ids):
+        """Return the ones of `ids` the events table already holds, looked up a chunk at a time."""
+        stored = set()
+        for start in range(0, len(ids), STORED_IDS_CHUNK):
+            chunk = ids[start:start + STORED_IDS_CHUNK]
+            query = 'SELECT id FROM events WHERE id IN (%s)' % ', '.join('?' * len(chunk))
+            stored.update(tx_id for tx_id, in self.connection.execute(query, chunk))
+        return stored
+
+    def flush(self):
+        insert = 'INSERT OR IGNORE INTO events (%s) VALUES (%s)' % (
+            ', '.join(EVENT_COLUMNS), ', '.join('?' * len(EVENT_COLUMNS))
+        )
+        with self.connection:
+            # events already stored are ignored, only the ones actually inserted count towards the fees
+            stored = self.stored_ids([event.id for event in self.events])
+            self.connection.executemany(insert, [event_row(event) for event in self.events])
+            for event in self.events:
+                if event.id not in stored:
+                    stored.add(event.id)
+                    self.fees.add(event)
+            self.fees.save()
+            if self.cursor is not None:
+                self.checkpoint.save(*self.cursor)
+        self.events = []
+        self.pending_ids = set()
+        self.cursor = None
+        self.last_flush = monotonic()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,41 @@
+import sqlite3
+
+from all_contrat.decoders import decode_transaction
+from all_contrat.fixtures import sample_transaction, sample_context
+from all_contrat.sinks import SqliteSink
+
+
+def test_uint64_amounts_round_trip(tmp_path):
+    event = decode_transaction(sample_transaction('sale,buy,200/72'), sample_context())
+    event = event._replace(amount=2 ** 64 - 1, currency=2 ** 63, fee=2 ** 63 + 1)
+    sink = SqliteSink(str(tmp_path / 'indexer.sqlite'), flush_interval=0)
+    sink.write(event)
+    sink.flush()
+    assert list(sink.stored_events()) == [event]
+    # fee totals are clamped to the largest SQLite INTEGER
+    assert sink.fees.totals()[0][2:] == (2 ** 63, 'sale', 1, 2 ** 63 - 1)
+    sink.close()
+
+
+def test_integer_amount_columns_are_migrated(tmp_path):
+    path = str(tmp_path / 'indexer.sqlite')
+    connection = sqlite3.connect(path)
+    # the events table as written before amounts were stored as text, and before fees were decoded
+    connection.execute(
+        'CREATE TABLE events ('
+        'id TEXT PRIMARY KEY, round INTEGER, created_at INTEGER, chain TEXT, kind TEXT, app_id INTEGER, '
+        'type TEXT, market TEXT, amount INTEGER, currency INTEGER, from_address TEXT, nft_app_id INTEGER, '
+        'nft_id TEXT, ends_at INTEGER)'
+    )
+    connection.execute("INSERT INTO events VALUES ('TX0', 1, 1700000000, 'voi:testnet', 'sale', 1000, 'buy', "
+                       "'1/72', 5000000, 0, 'SELLER', 29088600, '7', NULL)")
+    connection.commit()
+    connection.close()
+
+    sink = SqliteSink(path, flush_interval=0)
+    event = next(sink.stored_events())
+    assert (event.id, event.amount, event.currency, event.fee) == ('TX0', 5_000_000, 0, None)
+    sink.write(event._replace(id='TX1', amount=2 ** 64 - 1))
+    sink.flush()
+    assert [event.amount for event in sink.stored_events()] == [5_000_000, 2 ** 64 - 1]
+    sink.close()
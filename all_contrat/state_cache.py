@@ -0,0 +1,171 @@
+from base64 import b64decode
+from bisect import bisect_right, insort
+from collections import OrderedDict
+from threading import Event, Lock
+
+
+def apply_state_delta(state: dict, delta):
+    """Return a copy of `state` with an indexer `global-state-delta` applied."""
+    state = dict(state)
+    for pair in delta:
+        key = b64decode(pair["key"])
+        value = pair["value"]
+        action = value["action"]
+        if action == 1:
+            # set byte array
+            state[key] = b64decode(value.get("bytes", ""))
+        elif action == 2:
+            # set uint64
+            state[key] = value.get("uint", 0)
+        elif action == 3:
+            state.pop(key, None)
+        else:
+            raise Exception(f"Unexpected state delta action: {action}")
+    return state
+
+
+def transaction_app_id(transaction):
+    if 'application-transaction' not in transaction:
+        return None
+    return transaction['application-transaction']['application-id'] or transaction.get('created-application-index')
+
+
+class GlobalStateCache:
+    """Global state of marketplace apps as of a given round, kept in an LRU keyed on (app_id, round).
+
+    Evicting a snapshot evicts all the snapshots of its app, since a lookup between two remaining
+    snapshots would otherwise return the state from before the evicted one.
+
+    Snapshots are seeded by replaying the app's history from its creation transaction
+    (`fetch_history(app_id, max_round)` yields the app's transactions in round order) and are
+    then advanced with the `global-state-delta` of every transaction passed to `observe`.
+    Every state change of the all_contrat contracts after creation sends a note to the fees
+    address, so a sequential scan of the fees address sees all of them and a snapshot stays
+    valid until the next one.
+
+    Scans may observe rounds ahead of the lookups, e.g. the pipeline observes while decoding and
+    looks state up later while enriching. A delta observed while the app is not cached is lost,
+    so each app tracks the round its snapshots are complete through (`through`) and the last
+    round of a lost delta (`pending`); a lookup past a lost delta fetches the history again.
+
+    The cache may be shared between threads; history fetches run outside the lock, and concurrent
+    misses on the same app wait for a single fetch.
+    """
+
+    def __init__(self, fetch_history, maxsize: int = 100_000):
+        self.fetch_history = fetch_history
+        self.maxsize = maxsize
+        self.snapshots = OrderedDict()
+        self.rounds = dict()
+        # app_id -> round the snapshots hold every change through
+        self.through = dict()
+        # app_id -> last round whose history was fetched, observing it again would apply deltas twice
+        self.fetched = dict()
+        # app_id -> last round of a delta observed while the app was not cached or already behind
+        self.pending = dict()
+        # app_id -> Event set when the history fetch in flight for the app is done
+        self.fetching = dict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def _put(self, app_id: int, round_num: int, state: dict):
+        key = (app_id, round_num)
+        if key not in self.snapshots:
+            insort(self.rounds.setdefault(app_id, []), round_num)
+        self.snapshots[key] = state
+        self.snapshots.move_to_end(key)
+        while len(self.snapshots) > self.maxsize:
+            # the app being stored stays, a history longer than maxsize overfills the cache for a while
+            old_app_id = next((old_app_id for old_app_id, _ in self.snapshots if old_app_id != app_id), None)
+            if old_app_id is None:
+                break
+            for old_round in self.rounds.pop(old_app_id):
+                del self.snapshots[(old_app_id, old_round)]
+            self.through.pop(old_app_id, None)
+            self.fetched.pop(old_app_id, None)
+
+    def _lookup(self, app_id: int, round_num: int):
+        rounds = self.rounds.get(app_id)
+        if not rounds:
+            return None
+        i = bisect_right(rounds, round_num)
+        if i == 0:
+            return None
+        key = (app_id, rounds[i - 1])
+        self.snapshots.move_to_end(key)
+        return self.snapshots[key]
+
+    def _behind(self, app_id: int):
+        """Whether a delta after the round the app's snapshots are complete through was lost."""
+        return self.pending.get(app_id, -1) > self.through[app_id]
+
+    def _valid(self, app_id: int, round_num: int):
+        if app_id not in self.through:
+            return None
+        if round_num > self.through[app_id] and self._behind(app_id):
+            return None
+        return self._lookup(app_id, round_num)
+
+    def observe(self, transaction):
+        """Advance cached snapshots with the state deltas of a transaction and its inner transactions."""
+        app_id = transaction_app_id(transaction)
+        delta = transaction.get('global-state-delta')
+        if app_id is not None and delta is not None:
+            round_num = transaction['confirmed-round']
+            with self.lock:
+                if 'created-application-index' in transaction:
+                    self._put(app_id, round_num, apply_state_delta(dict(), delta))
+                    self.through[app_id] = round_num
+                    self.pending.pop(app_id, None)
+                elif round_num <= self.fetched.get(app_id, -1):
+                    # already part of the history the snapshots were built from
+                    pass
+                elif app_id in self.through and not self._behind(app_id):
+                    self._put(app_id, round_num, apply_state_delta(self._lookup(app_id, round_num), delta))
+                    self.through[app_id] = max(self.through[app_id], round_num)
+                else:
+                    self.pending[app_id] = max(self.pending.get(app_id, -1), round_num)
+        for inner_txn in transaction.get('inner-txns', []):
+            if 'confirmed-round' not in inner_txn:
+                inner_txn = dict(inner_txn, **{'confirmed-round': transaction['confirmed-round']})
+            self.observe(inner_txn)
+
+    def get(self, app_id: int, round_num: int):
+        while True:
+            with self.lock:
+                state = self._valid(app_id, round_num)
+                if state is not None:
+                    self.hits += 1
+                    return state
+                fetching = self.fetching.get(app_id)
+                if fetching is None:
+                    fetching = self.fetching[app_id] = Event()
+                    self.misses += 1
+                    break
+            # another thread is fetching the app's history, which likely covers this round too
+            fetching.wait()
+        try:
+            history = []
+            state = dict()
+            for transaction in self.fetch_history(app_id, round_num):
+                delta = transaction.get('global-state-delta')
+                if delta is not None:
+                    state = apply_state_delta(state, delta)
+                    history.append((transaction['confirmed-round'], state))
+            history.append((round_num, state))
+            with self.lock:
+                for snapshot_round, snapshot in history:
+                    self._put(app_id, snapshot_round, snapshot)
+                self.through[app_id] = max(self.through.get(app_id, -1), round_num)
+                self.fetched[app_id] = max(self.fetched.get(app_id, -1), round_num)
+                if self.pending.get(app_id, -1) <= round_num:
+                    self.pending.pop(app_id, None)
+        finally:
+            with self.lock:
+                del self.fetching[app_id]
+            fetching.set()
+        return state
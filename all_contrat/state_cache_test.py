@@ -0,0 +1,95 @@
+from base64 import b64encode
+
+from all_contrat.state_cache import GlobalStateCache
+
+
+def set_uint(key: bytes, value: int):
+    return {'key': b64encode(key).decode(), 'value': {'action': 2, 'uint': value}}
+
+
+def app_call(app_id: int, round_num: int, delta, create: bool = False):
+    transaction = {
+        'confirmed-round': round_num,
+        'application-transaction': {'application-id': 0 if create else app_id},
+        'global-state-delta': delta,
+    }
+    if create:
+        transaction['created-application-index'] = app_id
+    return transaction
+
+
+def test_history_is_fetched_once_per_app():
+    calls = []
+
+    def fetch_history(app_id, max_round):
+        calls.append((app_id, max_round))
+        return [app_call(app_id, 10, [set_uint(b'price', 5)], create=True)]
+
+    cache = GlobalStateCache(fetch_history)
+    assert cache.get(1, 12)[b'price'] == 5
+    assert cache.get(1, 15)[b'price'] == 5
+    assert calls == [(1, 12)]
+
+
+def test_observe_tracks_state_per_round():
+    cache = GlobalStateCache(lambda app_id, max_round: [])
+    cache.observe(app_call(1, 10, [set_uint(b'price', 5)], create=True))
+    cache.observe(app_call(1, 20, [set_uint(b'price', 7)]))
+    assert cache.get(1, 15)[b'price'] == 5
+    assert cache.get(1, 20)[b'price'] == 7
+    assert cache.misses == 0
+
+
+def test_lru_eviction():
+    cache = GlobalStateCache(lambda app_id, max_round: [], maxsize=2)
+    for app_id in (1, 2, 3):
+        cache.observe(app_call(app_id, 10, [set_uint(b'price', app_id)], create=True))
+    assert len(cache) == 2
+    assert 1 not in cache.rounds
+
+
+def test_eviction_drops_all_snapshots_of_an_app():
+    history = [app_call(1, 10, [set_uint(b'price', 1)], create=True), app_call(1, 20, [set_uint(b'price', 2)]),
+               app_call(1, 30, [set_uint(b'price', 3)])]
+    cache = GlobalStateCache(lambda app_id, max_round: [tx for tx in history
+                                                        if app_id == 1 and tx['confirmed-round'] <= max_round], maxsize=3)
+    cache.get(1, 30)
+    cache.get(1, 10)
+    cache.get(1, 30)
+    # the snapshot at round 20 is the least recently used one
+    cache.get(2, 5)
+    assert 1 not in cache.rounds
+    assert cache.get(1, 25)[b'price'] == 2
+
+
+def test_deltas_observed_before_the_app_is_cached_are_not_lost():
+    history = [app_call(1, 10, [set_uint(b'price', 5)], create=True), app_call(1, 20, [set_uint(b'price', 7)])]
+    cache = GlobalStateCache(lambda app_id, max_round: [tx for tx in history if tx['confirmed-round'] <= max_round])
+    # the pipeline observes while decoding, ahead of the lookups of the enrichment stage
+    cache.observe(history[1])
+    assert cache.get(1, 10)[b'price'] == 5
+    assert cache.get(1, 20)[b'price'] == 7
+    cache.observe(app_call(1, 30, [set_uint(b'price', 9)]))
+    assert cache.get(1, 30)[b'price'] == 9
+    assert cache.misses == 2
+
+
+def test_concurrent_misses_fetch_the_history_once():
+    from threading import Thread
+    from time import sleep
+
+    calls = []
+
+    def fetch_history(app_id, max_round):
+        calls.append(app_id)
+        sleep(0.05)
+        return [app_call(app_id, 10, [set_uint(b'price', 5)], create=True)]
+
+    cache = GlobalStateCache(fetch_history)
+    threads = [Thread(target=cache.get, args=(1, 12)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert cache.get(1, 12)[b'price'] == 5